@@ -1,35 +1,58 @@
+import asyncio
+import json
 import os
-import random
-import requests
 import logging
-import json
-from flask import Flask, request
+import time
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext
+from gita_corpus import SCRIPTS, STYLES, TextStores, align_stores, load_corpus, parse_shlokas
+from gita_io import AsyncHTTPClient, configure_blocking_pool, run_blocking
+from gita_audio_catalog import CATALOG_FILE, load_catalog
+from gita_audio_cache import AUDIO_SETS, VARIANTS_MANIFEST, AudioHandleCache, AudioVariants, all_audio_keys, audio_key, audio_path
+from gita_commands import Command, parse as parse_command
+from gita_meanings import MeaningsStore
+from gita_metrics import COMMAND_SECONDS, counter, gauge
+from gita_padas import PADAS_PER_VERSE, PadaTable
+from gita_review import GRADES, ReviewDeck, item_kind, pada_item, verse_item
+from gita_send import MeteredRequest, SendPipeline
+from gita_server import WebhookServer
+from gita_shuffle import draw, draw_unused, new_state
+from gita_sessions import Session, create_session_backend
+from gita_render import DEFAULT_LANGUAGES, ResponseCache, store_label
+from gita_search import PadaIndex, PrefixIndex, build_word_index
+from gita_translit import is_indic, to_telugu_block, transliterate
 
 # Configure logging
 logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Flask app
-app = Flask(__name__)
-
 # Bot Token & Webhook URL from environment variables
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Optional secret Telegram echoes in X-Telegram-Bot-Api-Secret-Token on every webhook call
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Concurrent update workers and the number of updates that may wait for them
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+# Render all verse messages at startup instead of on first access
+PRERENDER_RESPONSES = os.getenv("PRERENDER_RESPONSES", "1") == "1"
+# "local" (default) reads gita_corpus.bin, "remote" downloads the text files from GitHub
+SHLOKA_SOURCE = os.getenv("SHLOKA_SOURCE", "local").lower()
 
 if not TOKEN:
     raise ValueError("❌ TELEGRAM_BOT_TOKEN is missing! Set it in the environment variables.")
 if not GITHUB_TOKEN:
-    logger.warning("❌ GITHUB_TOKEN is missing! Meanings functionality will be unavailable.")
+    logger.warning("❌ GITHUB_TOKEN is missing! Meanings will be refreshed from GitHub without authentication.")
 
 # GitHub repository details
 REPO_OWNER = "pubsaroja"
 REPO_NAME = "bhagavad-gita-bot"
 MEANINGS_FILE = "meanings.txt"
+# Seconds between conditional refreshes of the meanings from GitHub (0 disables refreshing)
+MEANINGS_REFRESH_TTL = int(os.getenv("MEANINGS_REFRESH_TTL", 3600))
 
-# File URLs for shloka data
+# File URLs for shloka data (SHLOKA_SOURCE=remote)
 HINDI_WITH_UVACHA_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/refs/heads/main/BG%20Hindi%20with%20Uvacha.txt"
 TELUGU_WITH_UVACHA_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/refs/heads/main/BG%20Telugu%20with%20Uvacha.txt"
 ENGLISH_WITH_UVACHA_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/refs/heads/main/BG%20English%20with%20Uvacha.txt"
@@ -37,449 +60,581 @@ HINDI_WITHOUT_UVACHA_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad
 TELUGU_WITHOUT_UVACHA_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/refs/heads/main/BG%20Telugu%20Without%20Uvacha.txt"
 ENGLISH_WITHOUT_UVACHA_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/refs/heads/main/BG%20English%20without%20Uvacha.txt"
 
-# Audio URLs
-AUDIO_QUARTER_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/main/AudioQuarter/"
-AUDIO_FULL_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/main/AudioFullSGS/"
-
-# Session data to track user interactions
-session_data = {}
+# Audio sets used for the first quarter and the full shloka
+AUDIO_QUARTER_SET = "AudioQuarter"
+AUDIO_FULL_SET = "AudioFullSGS"
+# Manifest of the compact audio variants written by transcode_audio.py, and the variants clients can play
+# ("opus" voice notes, low-bitrate "mp3"); the smallest playable file is sent
+AUDIO_VARIANTS = os.getenv("AUDIO_VARIANTS", VARIANTS_MANIFEST)
+AUDIO_FORMATS = [name.strip() for name in os.getenv("AUDIO_FORMATS", "opus,mp3").split(",") if name.strip()]
+# Catalog of the local audio files written by generate_audio_index.py
+AUDIO_CATALOG = os.getenv("AUDIO_CATALOG", CATALOG_FILE)
+
+# SQLite file holding state that must survive restarts (Telegram audio handles, ...)
+BOT_STATE_DB = os.getenv("BOT_STATE_DB", "bot_state.db")
+# Session storage: "sqlite" (persistent, stored in BOT_STATE_DB) or "memory"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 10000))
+SESSION_TTL = int(os.getenv("SESSION_TTL", 30 * 24 * 3600))
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", 5))
+# Outgoing message rate limits (messages per second) for multi-verse replies
+CHAT_SEND_RATE = float(os.getenv("CHAT_SEND_RATE", 1))
+CHAT_SEND_BURST = int(os.getenv("CHAT_SEND_BURST", 3))
+GLOBAL_SEND_RATE = float(os.getenv("GLOBAL_SEND_RATE", 30))
+# Telegram user ids allowed to run /warmup, comma separated
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 4))
+# Build the word index behind "find" and "define" at startup
+WORD_INDEX = os.getenv("WORD_INDEX", "1") == "1"
+WORD_INDEX_FILE = "gita_word_index.txt"
+EXTENDED_MEANINGS_FILE = "meanings_extended.json"
+# Threads for blocking work (SQLite, large JSON parsing) moved off the event loop
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", 4))
+# Outgoing HTTP calls (GitHub): pooled connections, concurrency cap, timeout in seconds and retries
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", 10))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+
+configure_blocking_pool(BLOCKING_WORKERS)
+
+
+def make_http_client():
+    return AsyncHTTPClient(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_concurrency=HTTP_MAX_CONCURRENCY,
+        timeout=HTTP_TIMEOUT,
+        retries=HTTP_RETRIES,
+    )
 
-# Load shlokas from GitHub
-def load_shlokas_from_github(url):
-    response = requests.get(url)
+# Load shlokas from GitHub (only used when SHLOKA_SOURCE=remote)
+async def load_shlokas_from_github(http, url):
+    try:
+        response = await http.get(url)
+    except Exception as e:
+        logger.error(f"⚠️ Error fetching data from {url}: {e}")
+        return {}
     if response.status_code != 200:
         logger.error(f"⚠️ Error fetching data from {url} (Status Code: {response.status_code})")
         return {}
-    shlokas = {}
-    current_number = None
-    current_text = []
-    lines = response.text.split("\n")
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        parts = line.split("\t", 1)
-        if len(parts) == 2:
-            if current_number:
-                chapter, verse = current_number.split(".")[:2]
-                if chapter not in shlokas:
-                    shlokas[chapter] = []
-                shlokas[chapter].append((verse, "\n".join(current_text)))
-            current_number = parts[0]
-            current_text = [parts[1]]
-        else:
-            current_text.append(line)
-    if current_number:
-        chapter, verse = current_number.split(".")[:2]
-        if chapter not in shlokas:
-            shlokas[chapter] = []
-        shlokas[chapter].append((verse, "\n".join(current_text)))
-    return shlokas
-
-# Load all shlokas into memory
-shlokas_hindi = load_shlokas_from_github(HINDI_WITHOUT_UVACHA_URL)
-shlokas_telugu = load_shlokas_from_github(TELUGU_WITHOUT_UVACHA_URL)
-shlokas_english = load_shlokas_from_github(ENGLISH_WITHOUT_UVACHA_URL)
-full_shlokas_hindi = load_shlokas_from_github(HINDI_WITH_UVACHA_URL)
-full_shlokas_telugu = load_shlokas_from_github(TELUGU_WITH_UVACHA_URL)
-full_shlokas_english = load_shlokas_from_github(ENGLISH_WITH_UVACHA_URL)
-
-# Fetch meanings file from GitHub using download_url
-def fetch_meanings_file():
-    if not GITHUB_TOKEN:
-        logger.error("No GITHUB_TOKEN provided.")
-        return None
-    url = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/contents/{MEANINGS_FILE}"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        json_response = response.json()
-        logger.info(f"GitHub API response: {json.dumps(json_response, indent=2)}")
-        if "download_url" not in json_response:
-            logger.error(f"Unexpected GitHub API response: 'download_url' field missing.")
-            return None
-        download_url = json_response["download_url"]
-        raw_response = requests.get(download_url, headers=headers, timeout=10)
-        raw_response.raise_for_status()
-        content = raw_response.text
-        if not content.strip():
-            logger.error("Fetched meanings.txt is empty.")
-            return None
-        logger.info(f"Raw meanings.txt content: {content[:100]}...")
-        return json.loads(content)
-    except requests.RequestException as e:
-        logger.error(f"Failed to fetch {MEANINGS_FILE} from GitHub: {str(e)}")
-        return None
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse meanings.txt as JSON: {str(e)}")
-        return None
+    return parse_shlokas(response.text)
+
+# Download all six text files concurrently with a client that only lives for the startup load
+async def load_remote_stores():
+    urls = {
+        "hindi": HINDI_WITHOUT_UVACHA_URL,
+        "telugu": TELUGU_WITHOUT_UVACHA_URL,
+        "english": ENGLISH_WITHOUT_UVACHA_URL,
+        "hindi_full": HINDI_WITH_UVACHA_URL,
+        "telugu_full": TELUGU_WITH_UVACHA_URL,
+        "english_full": ENGLISH_WITH_UVACHA_URL,
+    }
+    async with make_http_client() as http:
+        stores = await asyncio.gather(*(load_shlokas_from_github(http, url) for url in urls.values()))
+    return dict(zip(urls, stores))
+
+# Load the shlokas from the pre-compiled local corpus unless remote loading is configured.
+# Every store is a list indexed by the global verse ordinal of verse_table; stores are decoded
+# on first use, so the other scripts only take memory once a user has picked them.
+corpus = load_corpus()
+if SHLOKA_SOURCE == "remote":
+    verse_table, remote_texts = align_stores(asyncio.run(load_remote_stores()))
+    texts = TextStores(corpus, preloaded=remote_texts)
+else:
+    verse_table = corpus.verse_table
+    texts = TextStores(corpus)
+shlokas_telugu = texts["telugu"]
+logger.info(f"Loaded {len(verse_table)} shlokas ({SHLOKA_SOURCE})")
+
+# Verse messages are rendered once per display mode and then served from memory
+response_cache = ResponseCache(verse_table, texts)
+if PRERENDER_RESPONSES:
+    response_cache.prerender()
+
+# Per-user sessions, bounded in memory and persisted in batches
+sessions = create_session_backend(SESSION_BACKEND, BOT_STATE_DB, SESSION_CACHE_SIZE, SESSION_TTL)
+
+# Telegram file_ids of audio already sent once, so repeat sends skip the download from GitHub
+audio_handles = AudioHandleCache(BOT_STATE_DB, AudioVariants(AUDIO_VARIANTS, AUDIO_FORMATS))
+
+# Multi-verse replies: merged texts and audio media groups, sent concurrently within Telegram's flood limits
+send_pipeline = SendPipeline(audio_handles, per_chat_rate=CHAT_SEND_RATE, per_chat_burst=CHAT_SEND_BURST, global_rate=GLOBAL_SEND_RATE)
+
+# Caches whose hit counts are exported on /metrics; all values are read only when the endpoint is scraped
+METERED_CACHES = {"audio_handles": audio_handles, "responses": response_cache, "sessions": sessions}
+
+def cache_lookups():
+    lookups = {}
+    for name, cache in METERED_CACHES.items():
+        if hasattr(cache, "hits"):
+            lookups[name, "hit"], lookups[name, "miss"] = cache.hits, cache.misses
+    return lookups
+
+def cache_hit_ratios():
+    lookups = cache_lookups()
+    ratios = {}
+    for (name, _) in lookups:
+        total = lookups[name, "hit"] + lookups[name, "miss"]
+        ratios[(name,)] = lookups[name, "hit"] / total if total else 0.0
+    return ratios
+
+counter("gita_cache_lookups_total", "Cache lookups, by cache and result", ("cache", "result"), callback=cache_lookups)
+gauge("gita_cache_hit_ratio", "Share of cache lookups answered from memory", ("cache",), callback=cache_hit_ratios)
+gauge("gita_sessions_cached", "Sessions held in memory", callback=lambda: len(sessions))
+gauge("gita_audio_handles", "Telegram file_ids known for audio files", callback=lambda: len(audio_handles))
+
+# Shared HTTP client for calls made while the bot is running; closed in post_shutdown
+http_client = make_http_client()
+
+# Meanings are served from memory and refreshed from GitHub in the background
+meanings_store = MeaningsStore(
+    http=http_client,
+    remote_url=f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/contents/{MEANINGS_FILE}" if MEANINGS_REFRESH_TTL > 0 else None,
+    token=GITHUB_TOKEN,
+    ttl=MEANINGS_REFRESH_TTL,
+)
 
 # Get meaning of a shloka
 def get_meaning(shloka_id):
-    meanings = fetch_meanings_file()
-    if meanings is None:
-        return "❌ Could not fetch meanings. Check GitHub token or meanings.txt file."
-    if shloka_id in meanings:
-        data = meanings[shloka_id]
-        word_meanings = "\n".join([f"{word}: {meaning}" for word, meaning in data["ప్రతిపదార్థం"].items()]) if data["ప్రతిపదార్థం"] else "No word meanings available."
-        translation = data["అర్థము"]
-        return f"Word Meanings:\n{word_meanings}\n\nTranslation:\n{translation}"
+    meaning = meanings_store.get(shloka_id)
+    if meaning is not None:
+        return meaning
+    if not len(meanings_store):
+        return "❌ Could not load meanings. Check the meanings.txt file."
     return f"Meaning for Shloka {shloka_id} not found in meanings.txt."
 
+# Prefix index over the first quarter of every shloka (Telugu, without uvacha), built once at load time
+shloka_prefix_index = PrefixIndex((text, ordinal) for ordinal, text in enumerate(shlokas_telugu))
+
+def first_quarter(ordinal):
+    return shlokas_telugu[ordinal].split('\n')[0]
+
+# The four padas of every verse with their recordings, split out of the corpus once for practice and search
+audio_catalog = load_catalog(AUDIO_CATALOG)
+pada_table = PadaTable(corpus.verse_table, corpus.texts("telugu_full"), catalog=audio_catalog)
+
+# Typo-tolerant index over all four padas of every verse, keyed by pronunciation, for searches
+# such as "dharmaksetre" that match no verse beginning
+pada_index = PadaIndex((*pada_table.locate(pada_id), text) for pada_id, text in enumerate(pada_table.texts) if text)
+logger.info(f"Indexed {len(pada_index)} padas for fuzzy search")
+
+# Inverted word index over every script plus the word-by-word meanings, for "find" and "define".
+# The script texts are read straight from the corpus so building it does not keep them loaded.
+def load_word_index():
+    try:
+        with open(WORD_INDEX_FILE, encoding="utf-8-sig") as f:
+            word_meanings = f.read()
+        with open(EXTENDED_MEANINGS_FILE, encoding="utf-8") as f:
+            extended_meanings = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Could not load word meanings for the word index: {e}")
+        word_meanings, extended_meanings = None, None
+    stores = {name: corpus.texts(name) for name in corpus.store_names if name.endswith("_full")}
+    index = build_word_index(verse_table, stores, word_meanings, extended_meanings)
+    logger.info(f"Indexed {len(index)} words for find/define")
+    return index
+
+word_index = load_word_index() if WORD_INDEX else None
+
+def find_verses(term, session: Session):
+    results, total = word_index.find(term, limit=10)
+    session.search_prefix = None
+    if not results:
+        session.search_results = []
+        return f"No shlokas found containing '{term}'."
+    session.search_results = results
+    session.search_offset = len(results)
+    response = f"Found {total} shlokas containing '{term}' (showing best {len(results)}):\n"
+    for i, ordinal in enumerate(results, 1):
+        response += f"{i}. {verse_table.verse_id(ordinal)}: {first_quarter(ordinal)}\n"
+    return response + "\nReply with a number to see the full shloka."
+
+def define_word(word):
+    entries = word_index.define(word, limit=5)
+    if not entries:
+        return f"No meaning found for '{word}'."
+    return "\n".join(f"{text} ({verse_table.verse_id(ordinal)}): {meaning}" for ordinal, text, meaning in entries)
+
 # Search for shlokas starting with a specific letter or syllable
 def search_shlokas(starting_with, max_results=10, offset=0):
-    results = []
-    for chapter, shlokas in full_shlokas_telugu.items():
-        for verse, text in shlokas:
-            if text.strip().startswith(starting_with):
-                first_quarter = text.split('\n')[0]
-                results.append((chapter, verse, first_quarter))
-    total_results = len(results)
-    if max_results == -1:  # Return all results
-        return results[offset:], total_results
-    return results[offset:offset + max_results], total_results
-
-# Map Latin letters to Telugu syllables
-SYLLABLE_MAP = {
-    'a': 'అ', 'aa': 'ఆ', 'i': 'ఇ', 'ii': 'ఈ', 'u': 'ఉ', 'uu': 'ఊ',
-    'e': 'ఎ', 'ee': 'ఏ', 'ai': 'ఐ', 'o': 'ఒ', 'oo': 'ఓ', 'au': 'ఔ',
-    'ka': 'క', 'kha': 'ఖ', 'ga': 'గ', 'gha': 'ఘ', 'nga': 'ఙ',
-    'cha': 'చ', 'chha': 'ఛ', 'ja': 'జ', 'jha': 'ఝ', 'nya': 'ఞ',
-    'ta': 'ట', 'tha': 'ఠ', 'da': 'డ', 'dha': 'ఢ', 'na': 'ణ',
-    'tha': 'త', 'thha': 'థ', 'da': 'ద', 'dha': 'ధ', 'na': 'న',
-    'pa': 'ప', 'pha': 'ఫ', 'ba': 'బ', 'bha': 'భ', 'ma': 'మ',
-    'ya': 'య', 'ra': 'ర', 'la': 'ల', 'va': 'వ', 'sha': 'శ',
-    'ssa': 'ష', 'sa': 'స', 'ha': 'హ'
-}
-
-# Helper functions for chapter navigation
-def get_previous_chapter(chapter):
-    return "18" if chapter == "1" else str(int(chapter) - 1)
-
-def get_next_chapter(chapter):
-    return "1" if chapter == "18" else str(int(chapter) + 1)
-
-def get_shloka_at_offset(current_chapter, current_idx, offset):
-    chapter = current_chapter
-    idx = current_idx + offset
-    while idx < 0:
-        prev_chapter = get_previous_chapter(chapter)
-        num_shlokas_prev = len(full_shlokas_hindi[prev_chapter])
-        idx += num_shlokas_prev
-        chapter = prev_chapter
-    while idx >= len(full_shlokas_hindi[chapter]):
-        next_chapter = get_next_chapter(chapter)
-        idx -= len(full_shlokas_hindi[chapter])
-        chapter = next_chapter
-        if chapter == current_chapter:
-            return None, None
-    return chapter, idx
-
-# Get a specific shloka by chapter and verse index
-def get_shloka(chapter: str, verse_idx: int, with_audio: bool = False, audio_only: bool = False, full_audio: bool = False):
-    chapter = str(chapter)
-    if chapter not in full_shlokas_hindi or verse_idx >= len(full_shlokas_hindi[chapter]) or verse_idx < 0:
-        logger.warning(f"No shloka found at chapter {chapter}, index {verse_idx}")
+    return shloka_prefix_index.search(starting_with, offset=offset, limit=max_results)
+
+# Telugu prefix to search for, from Telugu or Devanagari text or Latin (ITRANS, IAST or plain) words such as "dharma"
+def get_search_prefix(text):
+    if is_indic(text):
+        return to_telugu_block(text)
+    if all(word.isalpha() for word in text.split()):
+        return transliterate(text, prefix=True)
+    return None
+
+def fuzzy_search(query, session: Session):
+    matches = pada_index.search(query, limit=10)
+    if not matches:
+        return None
+    session.search_prefix = None
+    session.search_results = [ordinal for ordinal, _, _ in matches]
+    session.search_offset = len(matches)
+    response = f"No shlokas start with '{query}', closest matches anywhere in a shloka:\n"
+    for i, (ordinal, pada, _) in enumerate(matches, 1):
+        response += f"{i}. {verse_table.verse_id(ordinal)} (pada {pada}): {pada_table.text(ordinal * PADAS_PER_VERSE + pada - 1)}\n"
+    return response + "\nReply with a number to see the full shloka."
+
+# Text stores shown to a session: its chosen script, or Telugu, Hindi and English
+def session_languages(session: Session):
+    return (session.script,) if session.script in texts else DEFAULT_LANGUAGES
+
+# Get a shloka by its global ordinal
+def get_shloka(ordinal: int, with_audio: bool = False, audio_only: bool = False, full_audio: bool = False, languages=DEFAULT_LANGUAGES):
+    if not 0 <= ordinal < len(verse_table):
+        logger.warning(f"No shloka found at ordinal {ordinal}")
         return None, None
-    verse, shloka_hindi = full_shlokas_hindi[chapter][verse_idx]
-    _, shloka_telugu = full_shlokas_telugu[chapter][verse_idx]
-    _, shloka_english = full_shlokas_english[chapter][verse_idx]
-    audio_file_name = f"{chapter}.{int(verse)}.mp3"
-    audio_url = AUDIO_FULL_URL if full_audio else AUDIO_QUARTER_URL
-    audio_link = f"{audio_url}{audio_file_name}" if (with_audio or audio_only) else None
-    text = f"{chapter}.{verse}\nTelugu:\n{shloka_telugu}\n\nHindi:\n{shloka_hindi}\n\nEnglish:\n{shloka_english}" if not audio_only else None
-    logger.info(f"Retrieved shloka {chapter}.{verse}, audio: {audio_link}")
-    return text, audio_link
-
-# Get a random shloka from a chapter
-def get_random_shloka(chapter: str, user_id: int, with_audio: bool = False, audio_only: bool = False):
-    if user_id not in session_data:
-        session_data[user_id] = {"used_shlokas": {}, "last_chapter": None, "last_index": None, "search_results": [], "search_state": {}}
-    chapter = str(chapter).strip()
-    if chapter == "0":
-        chapter = random.choice(list(shlokas_hindi.keys()))
-    if chapter not in shlokas_hindi:
+    chapter, verse = verse_table.verses[ordinal]
+    audio = audio_key(AUDIO_FULL_SET if full_audio else AUDIO_QUARTER_SET, chapter, verse) if (with_audio or audio_only) else None
+    text = response_cache.render(ordinal, uvacha=True, languages=languages) if not audio_only else None
+    logger.debug(f"Retrieved shloka {chapter}.{verse}, audio: {audio}")
+    return text, audio
+
+# Get a random shloka from a chapter, or from the whole Gita for chapter 0, never repeating one already drawn.
+# Each pool is walked in a per-session shuffled order, so a draw is O(1) instead of filtering the chapter.
+def get_random_shloka(chapter: str, session: Session, with_audio: bool = False, audio_only: bool = False):
+    chapter = str(chapter).strip().lstrip("0") or "0"
+    if chapter != "0" and chapter not in verse_table.chapters:
         return "❌ Invalid chapter number. Please enter a number between 0-18.", None
-    if chapter not in session_data[user_id]["used_shlokas"]:
-        session_data[user_id]["used_shlokas"][chapter] = set()
-    available_shlokas = [i for i in range(len(shlokas_hindi[chapter])) if i not in session_data[user_id]["used_shlokas"][chapter]]
-    if not available_shlokas:
+    pool = range(len(verse_table)) if chapter == "0" else verse_table.chapter_range(chapter)
+    state = session.draws.setdefault(chapter, new_state())
+    ordinal = draw_unused(state, pool, session.is_used)
+    if ordinal is None:
+        if chapter == "0":
+            return f"✅ All {len(verse_table)} shlokas have been shown! Use /reset to start again.", None
         return f"✅ All shlokas from chapter {chapter} have been shown! Try another chapter or /reset.", None
-    shloka_index = random.choice(available_shlokas)
-    session_data[user_id]["used_shlokas"][chapter].add(shloka_index)
-    session_data[user_id]["last_chapter"] = chapter
-    session_data[user_id]["last_index"] = shloka_index
-    verse, shloka_hindi = shlokas_hindi[chapter][shloka_index]
-    _, shloka_telugu = shlokas_telugu[chapter][shloka_index]
-    _, shloka_english = shlokas_english[chapter][shloka_index]
-    audio_file_name = f"{chapter}.{int(verse)}.mp3"
-    audio_link = f"{AUDIO_QUARTER_URL}{audio_file_name}" if (with_audio or audio_only) else None
-    text = f"{chapter}.{verse}\nTelugu:\n{shloka_telugu}\n\nHindi:\n{shloka_hindi}\n\nEnglish:\n{shloka_english}" if not audio_only else None
-    return text, audio_link
+    session.mark_used(ordinal)
+    session.last_ordinal = ordinal
+    session.last_item = verse_item(ordinal)
+    audio = audio_key(AUDIO_QUARTER_SET, *verse_table.verses[ordinal]) if (with_audio or audio_only) else None
+    text = response_cache.render(ordinal, uvacha=False, languages=session_languages(session)) if not audio_only else None
+    return text, audio
+
+# Recitation style of the session's script, SGS unless a Sringeri script was chosen
+def session_style(session: Session):
+    return session.script.rsplit("_", 1)[1] if session.script and session.script.rsplit("_", 1)[1] in STYLES else STYLES[0]
+
+# Random pada for practice ("q" any pada, "q1" first, "q3" third), never repeated until the pool is exhausted
+def get_practice_pada(command, chapter, session: Session, with_audio: bool = False, audio_only: bool = False):
+    if chapter is not None and chapter not in verse_table.chapters:
+        return "❌ Invalid chapter number. Please enter a number between 1-18.", None
+    pool = pada_table.pool(command, chapter)
+    name = command if chapter is None else f"{command}:{chapter}"
+    state = session.practice.setdefault(name, new_state())
+    position, restarted = draw(state, len(pool))
+    pada_id = pool[position]
+    ordinal, pada = pada_table.locate(pada_id)
+    session.last_ordinal = ordinal
+    session.last_item = pada_item(pada_id)
+    audio = pada_table.audio(pada_id, session_style(session)) if (with_audio or audio_only) else None
+    if audio_only:
+        return None, audio
+    text = f"{verse_table.verse_id(ordinal)} (pada {pada}):\n{pada_table.text(pada_id)}\n\n{RECITE_HINT}"
+    if restarted:
+        text = f"✅ All {len(pool)} padas practised, starting a new round.\n\n{text}"
+    return text, audio
+
+RECITE_HINT = "Recite the rest, reply 'f' to check, then grade it: again / hard / good / easy"
+
+def describe_item(item):
+    kind, value = item_kind(item)
+    if kind == "pada":
+        ordinal, pada = pada_table.locate(value)
+        return f"{verse_table.verse_id(ordinal)} pada {pada}"
+    return verse_table.verse_id(value)
+
+def format_wait(seconds):
+    if seconds < 3600:
+        return f"in {max(1, round(seconds / 60))} minutes"
+    if seconds < 86400:
+        return f"in {round(seconds / 3600)} hours"
+    days = round(seconds / 86400)
+    return "in 1 day" if days == 1 else f"in {days} days"
+
+# Grade the verse or pada shown last ("again", "hard", "good" or "easy") and schedule its next review
+def grade_last_item(grade, session: Session):
+    if session.last_item is None:
+        return "❌ Please request a Shloka first!"
+    if session.review is None:
+        session.review = ReviewDeck()
+    now = int(time.time())
+    due = session.review.grade(session.last_item, GRADES[grade], now)
+    return f"✅ {describe_item(session.last_item)}: next review {format_wait(due - now)}. Reply 'r' for your next review."
+
+# Next verse or pada due for review: its opening (first pada, or the pada itself) to recite from
+def get_review_item(session: Session, with_audio: bool = False, audio_only: bool = False):
+    deck = session.review
+    if not deck:
+        return "No shlokas to review yet. Grade a shloka after you see it (again / hard / good / easy) to start.", None
+    now = int(time.time())
+    item = deck.next_due(now)
+    if item is None:
+        due, _ = deck.upcoming()
+        return f"✅ Nothing to review now. Next review {format_wait(due - now)} ({len(deck)} in your deck).", None
+    kind, value = item_kind(item)
+    if kind == "pada":
+        (ordinal, _), prompt = pada_table.locate(value), pada_table.text(value)
+        audio = pada_table.audio(value, session_style(session))
+    else:
+        ordinal, prompt = value, first_quarter(value)
+        audio = audio_key(AUDIO_QUARTER_SET, *verse_table.verses[value])
+    session.last_ordinal = ordinal
+    session.last_item = item
+    audio = audio if (with_audio or audio_only) else None
+    return f"Review {describe_item(item)}:\n{prompt}\n\n{RECITE_HINT}", audio
 
 # Get a specific shloka by chapter and verse number
-def get_specific_shloka(chapter: str, verse: str, user_id: int, with_audio: bool = False, audio_only: bool = False, full_audio: bool = False):
-    if user_id not in session_data:
-        session_data[user_id] = {"used_shlokas": {}, "last_chapter": None, "last_index": None, "search_results": [], "search_state": {}}
+def get_specific_shloka(chapter: str, verse: str, session: Session, with_audio: bool = False, audio_only: bool = False, full_audio: bool = False):
     chapter = str(chapter)
     verse = str(verse)
-    if chapter not in full_shlokas_hindi:
+    if chapter not in verse_table.chapters:
         return "❌ Invalid chapter number. Please enter a number between 0-18.", None
-    for idx, (v, _) in enumerate(full_shlokas_hindi[chapter]):
-        if v == verse:
-            verse_text, shloka_hindi = full_shlokas_hindi[chapter][idx]
-            _, shloka_telugu = full_shlokas_telugu[chapter][idx]
-            _, shloka_english = full_shlokas_english[chapter][idx]
-            audio_file_name = f"{chapter}.{int(verse)}.mp3"
-            audio_link = f"{AUDIO_FULL_URL if full_audio else AUDIO_QUARTER_URL}{audio_file_name}" if (with_audio or audio_only) else None
-            session_data[user_id]["last_chapter"] = chapter
-            session_data[user_id]["last_index"] = idx
-            text = f"{chapter}.{verse}\nTelugu:\n{shloka_telugu}\n\nHindi:\n{shloka_hindi}\n\nEnglish:\n{shloka_english}" if not audio_only else None
-            return text, audio_link
-    return f"❌ Shloka {chapter}.{verse} not found!", None
+    ordinal = verse_table.ordinal(chapter, verse)
+    if ordinal is None:
+        return f"❌ Shloka {chapter}.{verse} not found!", None
+    session.last_ordinal = ordinal
+    session.last_item = verse_item(ordinal)
+    return get_shloka(ordinal, with_audio, audio_only, full_audio, session_languages(session))
 
 # Get the last requested shloka
-def get_last_shloka(user_id: int, with_audio: bool = False, audio_only: bool = False, full_audio: bool = False):
-    if user_id in session_data and session_data[user_id]["last_index"] is not None:
-        chapter = session_data[user_id]["last_chapter"]
-        shloka_index = session_data[user_id]["last_index"]
-        return get_shloka(chapter, shloka_index, with_audio, audio_only, full_audio)
+def get_last_shloka(session: Session, with_audio: bool = False, audio_only: bool = False, full_audio: bool = False):
+    if session.last_ordinal is not None:
+        return get_shloka(session.last_ordinal, with_audio, audio_only, full_audio, session_languages(session))
     return "❌ No previous shloka found. Please request one first!", None
 
-# Main message handler
+# Reply with a shloka's text and/or audio
+async def reply_shloka(message, response, audio, audio_only=False):
+    if not audio_only and response:
+        await message.reply_text(response)
+    if audio:
+        await audio_handles.reply_audio(message, audio)
+
+# Handlers of the parsed commands (see gita_commands). Each returns the branch name for the
+# per-command latency histogram when it differs from the command's kind.
+async def handle_word(message, session: Session, command):
+    term, = command.args
+    if word_index is None:
+        return await handle_search(message, session, Command("search", (f"{command.kind} {term}".strip(),)))
+    if not term:
+        example = "find karma" if command.kind == "find" else "define yuyutsavah"
+        await message.reply_text(f"❌ Usage: '{command.kind} <word>' (e.g., '{example}')")
+    elif command.kind == "find":
+        await message.reply_text(find_verses(term, session))
+    else:
+        await message.reply_text(define_word(term))
+
+async def handle_grade(message, session: Session, command):
+    await message.reply_text(grade_last_item(command.args[0], session))
+
+async def handle_specific(message, session: Session, command):
+    session.search_results = []
+    response, audio = get_specific_shloka(*command.args, session, command.with_audio, command.audio_only, full_audio=True)
+    await reply_shloka(message, response, audio, command.audio_only)
+
+# A bare number picks one of the pending search results if there are any, otherwise it is a chapter to draw from.
+# The pending results are the page just listed, numbered on from the pages before it: they end at search_offset.
+async def handle_number(message, session: Session, command):
+    number, = command.args
+    results = session.search_results
+    first = session.search_offset - len(results) + 1
+    if results and (first <= number < first + len(results) or number > len(verse_table.chapters)):
+        if number >= first + len(results):
+            await message.reply_text("Invalid selection. Please try again.")
+            return "select"
+        ordinal = results[number - first]
+        session.last_ordinal = ordinal
+        session.last_item = verse_item(ordinal)
+        response, audio = get_shloka(ordinal, command.with_audio, command.audio_only, True, session_languages(session))
+        await reply_shloka(message, response, audio, command.audio_only)
+        session.search_results = []
+        return "select"
+    session.search_results = []
+    response, audio = get_random_shloka(str(number), session, command.with_audio, command.audio_only)
+    await reply_shloka(message, response, audio, command.audio_only)
+    return "random"
+
+async def handle_search(message, session: Session, command):
+    query, = command.args
+    starting_with = get_search_prefix(query)
+    if not starting_with:
+        await message.reply_text(INVALID_INPUT)
+        return "invalid"
+    results, total_results = search_shlokas(starting_with, max_results=10)
+    session.search_prefix = starting_with
+    session.search_offset = len(results)
+    if results:
+        response = f"Found {total_results} shlokas starting with '{starting_with}' (showing first 10):\n"
+        for i, ordinal in enumerate(results, 1):
+            response += f"{i}. {verse_table.verse_id(ordinal)}: {first_quarter(ordinal)}\n"
+        if total_results > 10:
+            response += "Reply 'more' for the next 10 or 'all' for all remaining shlokas."
+        else:
+            response += "These are all the shlokas found."
+        response += "\nOr reply with a number to see the full shloka."
+        session.search_results = results
+        await message.reply_text(response)
+    else:
+        # Nothing from this search to page through or select; fuzzy_search lists its own matches if it finds any
+        session.search_prefix = None
+        session.search_results = []
+        response = fuzzy_search(query, session) if len(query) >= 3 else None
+        await message.reply_text(response or f"No shlokas found starting with '{starting_with}'.")
+    return "search"
+
+async def handle_page(message, session: Session, command):
+    if not session.search_prefix:
+        await message.reply_text(INVALID_INPUT)
+        return "invalid"
+    starting_with = session.search_prefix
+    offset = session.search_offset
+    # Pages come straight from the prefix index, nothing is copied into the session
+    results, total_results = search_shlokas(starting_with, max_results=10 if command.kind == "more" else -1, offset=offset)
+    session.search_offset = offset + len(results)
+    if results:
+        response = f"More shlokas starting with '{starting_with}':\n"
+        for i, ordinal in enumerate(results, offset + 1):
+            response += f"{i}. {verse_table.verse_id(ordinal)}: {first_quarter(ordinal)}\n"
+        if command.kind == "more" and session.search_offset < total_results:
+            response += "Reply 'more' for the next 10 or 'all' for all remaining shlokas."
+        response += "\nOr reply with a number to see the full shloka."
+        session.search_results = results
+        await message.reply_text(response)
+    else:
+        await message.reply_text(f"No more shlokas found starting with '{starting_with}'.")
+
+async def handle_meaning(message, session: Session, command):
+    shloka_id, = command.args
+    if shloka_id is not None:
+        await message.reply_text(get_meaning(shloka_id))
+    elif session.last_ordinal is not None:
+        await message.reply_text(get_meaning(verse_table.verse_id(session.last_ordinal)))
+    else:
+        await message.reply_text("❌ Please request a Shloka first!")
+
+async def handle_full(message, session: Session, command):
+    response, audio = get_last_shloka(session, command.with_audio, command.audio_only, full_audio=True)
+    await reply_shloka(message, response, audio, command.audio_only)
+
+# At most this many next shlokas per message, so one chat cannot hold its update worker for long
+MAX_NEXT = 5
+
+async def handle_next(message, session: Session, command):
+    count, = command.args
+    if not 1 <= count <= MAX_NEXT:
+        await message.reply_text(f"❌ Use n1-n{MAX_NEXT} for the next 1 to {MAX_NEXT} Shlokas (e.g., 'n2').")
+        return
+    if session.last_ordinal is None:
+        await message.reply_text("❌ Please request a Shloka first!")
+        return
+    current = session.last_ordinal
+    responses = []
+    audios = []
+    for i in range(1, count + 1):
+        response, audio = get_shloka(verse_table.offset(current, i), command.with_audio, command.audio_only, True, session_languages(session))
+        responses.append(response)
+        if audio:
+            audios.append(audio)
+    if audios or any(responses):
+        session.last_ordinal = verse_table.offset(current, count)
+        session.last_item = verse_item(session.last_ordinal)
+        await send_pipeline.send(message, responses, audios)
+    else:
+        await message.reply_text("❌ No next Shloka available!")
+
+async def handle_around(message, session: Session, command):
+    if session.last_ordinal is None:
+        await message.reply_text("❌ Please request a Shloka first!")
+        return
+    current = session.last_ordinal
+    responses = []
+    audios = []
+    for offset in (-2, -1, 0, 1, 2):
+        response, audio = get_shloka(verse_table.offset(current, offset), command.with_audio, command.audio_only, True, session_languages(session))
+        responses.append(response)
+        if audio:
+            audios.append(audio)
+    await send_pipeline.send(message, responses, audios)
+
+async def handle_review(message, session: Session, command):
+    response, audio = get_review_item(session, command.with_audio, command.audio_only)
+    await reply_shloka(message, response, audio, command.audio_only)
+
+async def handle_practice(message, session: Session, command):
+    response, audio = get_practice_pada(*command.args, session, command.with_audio, command.audio_only)
+    await reply_shloka(message, response, audio, command.audio_only)
+
+async def handle_audio(message, session: Session, command):
+    if session.last_ordinal is not None:
+        _, audio = get_shloka(session.last_ordinal, audio_only=True)
+        await audio_handles.reply_audio(message, audio)
+    else:
+        await message.reply_text("❌ No previous Shloka found. Please request one first!")
+
+COMMAND_HANDLERS = {
+    "find": handle_word,
+    "define": handle_word,
+    "grade": handle_grade,
+    "specific": handle_specific,
+    "number": handle_number,
+    "search": handle_search,
+    "more": handle_page,
+    "all": handle_page,
+    "mn": handle_meaning,
+    "f": handle_full,
+    "n": handle_next,
+    "p": handle_around,
+    "review": handle_review,
+    "practice": handle_practice,
+    "o": handle_audio,
+}
+
+INVALID_INPUT = (
+    "❌ Invalid input. Please use:\n"
+    "a, ba, etc.: Search shlokas by starting letter\n"
+    "dharmakshetre, yada yada: Search shlokas by their words (ITRANS, IAST or any spelling)\n"
+    "more: Next 10 search results\n"
+    "all: All remaining search results\n"
+    "1-10: Select a shloka from search results\n"
+    "0-18: Random Shloka\n"
+    "chapter.verse: Specific Shloka (e.g., 18.1)\n"
+    "f: Last full Shloka\n"
+    "n1-n5: Next Shloka(s)\n"
+    "p: Previous 2, current & next 2 Shlokas\n"
+    "mn: Meaning of last Shloka\n"
+    "mn <shloka_id>: Meaning of specific Shloka (e.g., 'mn 1.1')\n"
+    "o: Audio of last Shloka\n"
+    "q, q1, q3: Practice a random pada (any, first or third), optionally from a chapter (e.g., 'q1 2')\n"
+    "again, hard, good, easy: Grade the last Shloka or pada for review\n"
+    "r: Next Shloka or pada due for review\n"
+    "Add 'a' for audio with text (e.g., '1a')\n"
+    "Add 'ao' for audio only (e.g., '1ao')\n"
+    "Use /reset to start fresh"
+)
+
+# Main message handler: parse the message once and dispatch it to the command's handler
 async def handle_message(update: Update, context: CallbackContext):
+    session = None
+    # Command branch the message ends up in, for the per-command latency histogram
+    branch = "invalid"
+    started = time.perf_counter()
     try:
-        original_text = update.message.text.strip().lower()
+        command = parse_command(update.message.text)
         user_id = update.message.from_user.id
-        logger.info(f"Received input: {original_text} from user {user_id}")
-
-        audio_only = original_text.endswith("ao")
-        with_audio = original_text.endswith("a") and not audio_only and original_text not in SYLLABLE_MAP
-        base_command = original_text
-        if audio_only:
-            base_command = original_text[:-2]
-        elif with_audio:
-            base_command = original_text[:-1]
-
-        full_audio = base_command in ["f", "n1", "n2", "n3", "n4", "n5", "p"] or with_audio or audio_only
-
-        logger.info(f"Base command: {base_command}, audio_only: {audio_only}, with_audio: {with_audio}, full_audio: {full_audio}")
-
-        if "." in base_command:
-            try:
-                chapter, verse = base_command.split(".", 1)
-                if chapter.isdigit() and verse.isdigit():
-                    response, audio_url = get_specific_shloka(chapter, verse, user_id, with_audio, audio_only, full_audio)
-                    if not audio_only and response:
-                        await update.message.reply_text(response)
-                    if audio_url:
-                        await update.message.reply_audio(audio_url)
-                    return
-            except ValueError:
-                pass
-
-        if base_command.isdigit():
-            response, audio_url = get_random_shloka(base_command, user_id, with_audio, audio_only)
-            if not audio_only and response:
-                await update.message.reply_text(response)
-            if audio_url:
-                await update.message.reply_audio(audio_url)
-            return
-
-        if base_command in SYLLABLE_MAP:
-            starting_with = SYLLABLE_MAP[base_command]
-            results, total_results = search_shlokas(starting_with, max_results=10)
-            session_data[user_id]["search_state"] = {
-                "starting_with": starting_with,
-                "all_results": results + search_shlokas(starting_with, max_results=-1, offset=10)[0],
-                "offset": 10
-            }
-            if results:
-                response = f"Found {total_results} shlokas starting with '{starting_with}' (showing first 10):\n"
-                for i, (chapter, verse, first_quarter) in enumerate(results, 1):
-                    response += f"{i}. {chapter}.{verse}: {first_quarter}\n"
-                if total_results > 10:
-                    response += "Reply 'more' for the next 10 or 'all' for all remaining shlokas."
-                else:
-                    response += "These are all the shlokas found."
-                response += "\nOr reply with a number to see the full shloka."
-                session_data[user_id]["search_results"] = results
-                await update.message.reply_text(response)
-            else:
-                await update.message.reply_text(f"No shlokas found starting with '{starting_with}'.")
-            return
-
-        if base_command in ["more", "all"] and "search_state" in session_data.get(user_id, {}):
-            search_state = session_data[user_id]["search_state"]
-            starting_with = search_state["starting_with"]
-            all_results = search_state["all_results"]
-            offset = search_state["offset"]
-            if base_command == "more":
-                results = all_results[offset:offset + 10]
-                session_data[user_id]["search_state"]["offset"] += 10
-            else:
-                results = all_results[offset:]
-                session_data[user_id]["search_state"]["offset"] = len(all_results)
-            if results:
-                response = f"More shlokas starting with '{starting_with}':\n"
-                start_index = offset + 1 if base_command == "more" else offset + 1
-                for i, (chapter, verse, first_quarter) in enumerate(results, start_index):
-                    response += f"{i}. {chapter}.{verse}: {first_quarter}\n"
-                if base_command == "more" and session_data[user_id]["search_state"]["offset"] < len(all_results):
-                    response += "Reply 'more' for the next 10 or 'all' for all remaining shlokas."
-                response += "\nOr reply with a number to see the full shloka."
-                session_data[user_id]["search_results"] = results
-                await update.message.reply_text(response)
-            else:
-                await update.message.reply_text(f"No more shlokas found starting with '{starting_with}'.")
-            return
-
-        if base_command.isdigit() and "search_results" in session_data.get(user_id, {}):
-            selection = int(base_command) - 1
-            results = session_data[user_id]["search_results"]
-            if 0 <= selection < len(results):
-                chapter, verse, _ = results[selection]
-                response, audio_url = get_specific_shloka(chapter, verse, user_id, with_audio, audio_only, full_audio)
-                if not audio_only and response:
-                    await update.message.reply_text(response)
-                if audio_url:
-                    await update.message.reply_audio(audio_url)
-                session_data[user_id]["search_results"] = []
-            else:
-                await update.message.reply_text("Invalid selection. Please try again.")
-            return
-
-        if base_command == "mn" or base_command.startswith("mn "):
-            parts = base_command.split()
-            if len(parts) == 1:
-                if user_id in session_data and session_data[user_id]["last_index"] is not None:
-                    chapter = session_data[user_id]["last_chapter"]
-                    verse, _ = full_shlokas_hindi[chapter][session_data[user_id]["last_index"]]
-                    shloka_id = f"{chapter}.{verse}"
-                    meaning = get_meaning(shloka_id)
-                    await update.message.reply_text(meaning)
-                else:
-                    await update.message.reply_text("❌ Please request a Shloka first!")
-            elif len(parts) == 2:
-                shloka_id = parts[1]
-                meaning = get_meaning(shloka_id)
-                await update.message.reply_text(meaning)
-            else:
-                await update.message.reply_text("❌ Invalid format. Use 'mn' or 'mn <shloka_id>' (e.g., 'mn 1.1')")
-            return
-
-        if base_command == "f":
-            response, audio_url = get_last_shloka(user_id, with_audio, audio_only, full_audio)
-            if not audio_only and response:
-                await update.message.reply_text(response)
-            if audio_url:
-                await update.message.reply_audio(audio_url)
-            return
-
-        if base_command.startswith("n") and base_command[1:].isdigit():
-            if user_id in session_data and session_data[user_id]["last_index"] is not None:
-                current_chapter = session_data[user_id]["last_chapter"]
-                current_idx = session_data[user_id]["last_index"]
-                count = int(base_command[1:])
-                responses = []
-                audio_urls = []
-                last_chapter = current_chapter
-                last_idx = current_idx
-                for i in range(count):
-                    next_chapter, next_idx = get_shloka_at_offset(current_chapter, current_idx, i + 1)
-                    if next_chapter is None:
-                        break
-                    response, audio_url = get_shloka(next_chapter, next_idx, with_audio, audio_only, full_audio)
-                    if response or audio_url:
-                        responses.append(response)
-                        if audio_url:
-                            audio_urls.append(audio_url)
-                        last_chapter = next_chapter
-                        last_idx = next_idx
-                    else:
-                        break
-                if audio_urls or responses:
-                    session_data[user_id]["last_chapter"] = last_chapter
-                    session_data[user_id]["last_index"] = last_idx
-                    if not audio_only:
-                        for response in responses:
-                            if response:
-                                await update.message.reply_text(response)
-                    for audio_url in audio_urls:
-                        await update.message.reply_audio(audio_url)
-                else:
-                    await update.message.reply_text("❌ No next Shloka available!")
-            else:
-                await update.message.reply_text("❌ Please request a Shloka first!")
-            return
-
-        if base_command == "p":
-            if user_id in session_data and session_data[user_id]["last_index"] is not None:
-                current_chapter = session_data[user_id]["last_chapter"]
-                current_idx = session_data[user_id]["last_index"]
-                offsets = [-2, -1, 0, 1, 2]
-                responses = []
-                audio_urls = []
-                logger.info(f"Processing 'p' for chapter {current_chapter}, current index {current_idx}")
-                for offset in offsets:
-                    chapter, idx = get_shloka_at_offset(current_chapter, current_idx, offset)
-                    if chapter is None:
-                        continue
-                    response, audio_url = get_shloka(chapter, idx, with_audio, audio_only, full_audio)
-                    if response or audio_url:
-                        responses.append(response)
-                        if audio_url:
-                            audio_urls.append(audio_url)
-                            logger.info(f"Audio URL generated for {chapter}.{idx + 1}: {audio_url}")
-                    else:
-                        logger.warning(f"No data for chapter {chapter}, index {idx}")
-                if audio_urls or responses:
-                    if not audio_only:
-                        for response in responses:
-                            if response:
-                                await update.message.reply_text(response)
-                    for audio_urls in audio_urls:
-                        await update.message.reply_audio(audio_url)
-                else:
-                    await update.message.reply_text("❌ No shlokas available in this range!")
-            else:
-                await update.message.reply_text("❌ Please request a Shloka first!")
-            return
-
-        if base_command == "o":
-            if user_id in session_data and session_data[user_id]["last_index"] is not None:
-                chapter = session_data[user_id]["last_chapter"]
-                shloka_index = session_data[user_id]["last_index"]
-                verse, _ = full_shlokas_hindi[chapter][shloka_index]
-                audio_file_name = f"{chapter}.{int(verse)}.mp3"
-                audio_link = f"{AUDIO_QUARTER_URL}{audio_file_name}"
-                await update.message.reply_audio(audio_link)
-            else:
-                await update.message.reply_text("❌ No previous Shloka found. Please request one first!")
-            return
-
-        await update.message.reply_text(
-            "❌ Invalid input. Please use:\n"
-            "a, ba, etc.: Search shlokas by starting letter\n"
-            "more: Next 10 search results\n"
-            "all: All remaining search results\n"
-            "1-10: Select a shloka from search results\n"
-            "0-18: Random Shloka\n"
-            "chapter.verse: Specific Shloka (e.g., 18.1)\n"
-            "f: Last full Shloka\n"
-            "n1-n5: Next Shloka(s)\n"
-            "p: Previous 2, current & next 2 Shlokas\n"
-            "mn: Meaning of last Shloka\n"
-            "mn <shloka_id>: Meaning of specific Shloka (e.g., 'mn 1.1')\n"
-            "o: Audio of last Shloka\n"
-            "Add 'a' for audio with text (e.g., '1a')\n"
-            "Add 'ao' for audio only (e.g., '1ao')\n"
-            "Use /reset to start fresh"
-        )
+        logger.debug(f"Received {command} from user {user_id}")
+        session = await sessions.aload(user_id)
+        branch = await COMMAND_HANDLERS[command.kind](update.message, session, command) or command.kind
     except Exception as e:
+        branch = "error"
         logger.error(f"Error processing message: {str(e)}", exc_info=True)
         await update.message.reply_text("❌ An error occurred. Please try again or contact support.")
+    finally:
+        if session is not None:
+            sessions.save(session)
+        COMMAND_SECONDS.observe(time.perf_counter() - started, branch)
 
 # Command handlers
 async def start(update: Update, context: CallbackContext):
@@ -488,6 +643,7 @@ async def start(update: Update, context: CallbackContext):
         "Jai Gurudatta!\n"
         "Welcome to Srimad Bhagavadgita Random Practice chatbot.\n"
         "a, ba, etc. → Search shlokas by starting letter\n"
+        "dharmakshetre, yada yada → Search shlokas by their words (ITRANS, IAST or any spelling)\n"
         "more → Next 10 search results\n"
         "all → All remaining search results\n"
         "1-10 → Select shloka from search results\n"
@@ -510,52 +666,114 @@ async def start(update: Update, context: CallbackContext):
         "mn → Meaning of last Shloka\n"
         "mn <shloka_id> → Meaning of specific Shloka (e.g., 'mn 1.1')\n"
         "o → Audio of last Shloka\n"
+        "q, q1, q3 → Practice a random pada (any, first or third)\n"
+        "q1 2 → Practice first padas of chapter 2 (add 'a' for audio)\n"
+        "again / hard / good / easy → Grade the last Shloka or pada for review\n"
+        "r → Next Shloka or pada due for review\n"
+        "find <word> → Shlokas containing a word (e.g., 'find karma')\n"
+        "define <word> → Meaning of a word (e.g., 'define yuyutsavah')\n"
+        "/script → Choose the script (e.g., '/script tamil sringeri')\n"
         "Use /reset to start fresh"
     )
 
 async def reset(update: Update, context: CallbackContext):
     user_id = update.message.from_user.id
-    if user_id in session_data:
-        del session_data[user_id]
+    await sessions.adelete(user_id)
     await update.message.reply_text("✅ Session reset! Start anew with any chapter.")
 
-# Flask webhook endpoint
-@app.route('/webhook', methods=['POST'])
-async def webhook():
-    try:
-        update = Update.de_json(request.get_json(), bot=application.bot)
-        if update:
-            await application.process_update(update)
-        return 'OK', 200
-    except Exception as e:
-        logger.error(f"Webhook error: {str(e)}", exc_info=True)
-        return 'Error', 500
+# Choose the script (and SGS or Sringeri style) shlokas are shown in for this user
+async def script(update: Update, context: CallbackContext):
+    session = await sessions.aload(update.message.from_user.id)
+    args = [arg.lower() for arg in context.args or ()]
+    current = store_label(session.script) if session.script else "Telugu, Hindi and English"
+    if not args:
+        await update.message.reply_text(
+            f"Current script: {current}\n"
+            f"Use /script <{'|'.join(SCRIPTS)}> [{'|'.join(STYLES)}], or /script default"
+        )
+        return
+    if args[0] == "default":
+        session.script = None
+    else:
+        name = f"{args[0]}_{args[1] if len(args) > 1 else STYLES[0]}"
+        if name not in texts or args[0] not in SCRIPTS:
+            await update.message.reply_text(f"❌ Unknown script. Choose from: {', '.join(SCRIPTS)} (styles: {', '.join(STYLES)})")
+            return
+        session.script = name
+    sessions.save(session)
+    shown = store_label(session.script) if session.script else "Telugu, Hindi and English"
+    await update.message.reply_text(f"✅ Shlokas will be shown in {shown}.")
+
+# Pre-upload local audio files so every later send can reuse a Telegram file_id
+async def warmup(update: Update, context: CallbackContext):
+    user_id = update.message.from_user.id
+    if user_id not in ADMIN_USER_IDS:
+        await update.message.reply_text("❌ This command is only available to bot admins.")
+        return
+    audio_sets = context.args or list(AUDIO_SETS)
+    unknown = [name for name in audio_sets if name not in AUDIO_SETS]
+    if unknown:
+        await update.message.reply_text(f"❌ Unknown audio set(s): {', '.join(unknown)}. Use any of: {', '.join(AUDIO_SETS)}")
+        return
+    # Only files the audio catalog lists exist locally to be uploaded
+    catalogued = audio_catalog["files"]
+    keys = [key for key in all_audio_keys(verse_table, audio_sets) if not catalogued or audio_path(key) in catalogued]
+    missing = sum(audio_handles.source(key)[0] not in audio_handles for key in keys)
+    await update.message.reply_text(f"⏳ Uploading up to {missing} audio files...")
+
+    # Runs in the background so the update worker for this chat is not held up
+    async def run_warmup():
+        uploaded, failed = await audio_handles.warm_up(context.bot, update.message.chat_id, keys, concurrency=WARMUP_CONCURRENCY)
+        await update.message.reply_text(f"✅ Warm-up done: {uploaded} uploaded, {failed} failed, {len(audio_handles)} audio handles cached.")
+
+    context.application.create_task(run_warmup())
+
+# Write changed sessions to the session store in batches
+async def flush_sessions_periodically():
+    while True:
+        await asyncio.sleep(SESSION_FLUSH_INTERVAL)
+        try:
+            await sessions.aflush()
+        except Exception as e:
+            logger.error(f"Failed to flush sessions: {str(e)}", exc_info=True)
+
+async def post_init(application: Application):
+    application.create_task(flush_sessions_periodically())
+
+async def post_shutdown(application: Application):
+    await sessions.aflush()
+    await run_blocking(sessions.close)
+    await http_client.aclose()
 
 # Initialize Telegram application
-application = Application.builder().token(TOKEN).build()
+# Bot API calls go through MeteredRequest so /metrics counts them by method and status
+application = (
+    Application.builder().token(TOKEN).request(MeteredRequest(connection_pool_size=256))
+    .post_init(post_init).post_shutdown(post_shutdown).build()
+)
 
 # Register handlers
 application.add_handler(CommandHandler("start", start))
 application.add_handler(CommandHandler("reset", reset))
+application.add_handler(CommandHandler("script", script))
+application.add_handler(CommandHandler("warmup", warmup))
 application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
-# Main function to set up webhook
+# Main function: serve the webhook from the asyncio front end
 def main():
     logger.info("Starting the bot in webhook mode...")
     port = int(os.getenv("PORT", 8080))
     webhook_path = '/webhook'
-    webhook_url = f"{WEBHOOK_URL}{webhook_path}"
-    
-    # Set webhook
-    application.run_webhook(
-        listen="0.0.0.0",
-        port=port,
-        url_path=webhook_path,
-        webhook_url=webhook_url
+    webhook_url = f"{WEBHOOK_URL}{webhook_path}" if WEBHOOK_URL else None
+    server = WebhookServer(
+        application,
+        path=webhook_path,
+        secret_token=WEBHOOK_SECRET,
+        workers=UPDATE_WORKERS,
+        queue_size=UPDATE_QUEUE_SIZE,
     )
-    
-    # Start Flask app
-    app.run(host="0.0.0.0", port=port)
+    gauge("gita_update_queue_depth", "Updates waiting for a worker", callback=lambda: server.queued)
+    asyncio.run(server.serve("0.0.0.0", port, webhook_url))
 
 if __name__ == "__main__":
     main()
@@ -1,60 +1,262 @@
 import os
 import json
 import random
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
+from werkzeug.wsgi import wrap_file
 from google.cloud import dialogflow_v2 as dialogflow
+from gita_audio_catalog import load_catalog
+from gita_parayana import ParayanaLibrary, parse_range
 
-app = Flask(__name__)
-
-# Load audio index
 try:
-    with open('gita_audio_index.json', 'r') as f:
-        audio_index = json.load(f)
-except FileNotFoundError:
-    print("Error: gita_audio_index.json not found")
-    audio_index = {}
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    def json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    json_loads = json.loads
+
+app = Flask(__name__)
 
 # Base URL for audio files (replace with your bucket URL)
 AUDIO_BASE_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/main/"
+# Public URL of this service, used for the continuous play stream (defaults to the request's host)
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL')
+STREAM_CHUNK_SIZE = 64 * 1024
+# Serve full shlokas as verse slices of the parayana recordings instead of the per-verse AudioFull files
+# (needs PUBLIC_BASE_URL; chapters without a recording keep their per-verse URLs)
+PARAYANA_FULL_AUDIO = os.environ.get('PARAYANA_FULL_AUDIO') == '1'
+
+
+class AudioCatalog:
+    """Chapter/verse tables and resolved audio URLs, built once from the verses of the audio catalog."""
+
+    def __init__(self, audio_index, base_url=AUDIO_BASE_URL):
+        # (chapter, verse) -> {'pada1' | 'pada3' | 'gurudatta' | 'sringeri': url}
+        self.urls = {}
+        for key, entry in audio_index.items():
+            # Only verses with a whole-verse recording count; stray pada files do not add verses
+            if 'AudioFullSGS' not in entry and 'AudioQuarter' not in entry:
+                continue
+            chapter, verse = (int(part) for part in key.split('.'))
+            padas = entry.get('AQ4PaadasSGS') or [None] * 4
+            paths = {
+                'pada1': padas[0] or entry.get('AudioQuarter'),
+                'pada3': padas[2],
+                'gurudatta': entry.get('AudioFullSGS'),
+                'sringeri': entry.get('AudioFullSringeri'),
+            }
+            self.urls[(chapter, verse)] = {name: f"{base_url}{path}".replace(' ', '%20') for name, path in paths.items() if path}
+        # Global ordinal table: every (chapter, verse) in reading order, and its position
+        self.verses = sorted(self.urls)
+        self.ordinals = {verse: ordinal for ordinal, verse in enumerate(self.verses)}
+        self.chapter_verses = {}
+        for chapter, verse in self.verses:
+            self.chapter_verses[chapter] = max(verse, self.chapter_verses.get(chapter, 0))
+
+    def max_verses(self, chapter):
+        return self.chapter_verses.get(chapter, 1)
+
+    def url(self, chapter, verse, quarter=None, style=None):
+        urls = self.urls.get((chapter, verse))
+        if urls is None:
+            return None
+        if quarter:
+            return urls.get(quarter)
+        if style:
+            return urls.get(style)
+        return None
+
+    def next_verse(self, chapter, verse):
+        """Verse after chapter.verse, wrapping from the last verse of chapter 18 to 1.1."""
+        ordinal = self.ordinals.get((chapter, verse))
+        if ordinal is not None:
+            return self.verses[(ordinal + 1) % len(self.verses)]
+        if verse + 1 <= self.max_verses(chapter):
+            return chapter, verse + 1
+        return chapter % 18 + 1, 1
+
+
+# Load the audio catalog written by generate_audio_index.py
+audio_catalog = AudioCatalog(load_catalog()["verses"])
 
 def get_max_verses(chapter):
-    """Calculate max verses for a chapter from audio_index."""
-    chapter_str = str(chapter)
-    verses = [int(key.split('.')[1]) for key in audio_index if key.startswith(chapter_str + '.')]
-    return max(verses) if verses else 1
+    """Max verses for a chapter from the precomputed catalog."""
+    return audio_catalog.max_verses(chapter)
 
 def get_audio_url(chapter, verse, quarter=None, style=None):
-    key = f"{chapter}.{verse}"
-    if key not in audio_index:
-        print(f"Error: No audio entry for {key}")
+    if (chapter, verse) not in audio_catalog.urls:
+        print(f"Error: No audio entry for {chapter}.{verse}")
+        return None
+    return audio_catalog.url(chapter, verse, quarter, style)
+
+class ResponseTemplates:
+    """Pre-serialized Dialogflow media responses; only the session context name is filled in per request.
+
+    A template is compiled on first use for each (chapter, verse, kind, variant), where kind is
+    'quarter' (variant pada1/pada3) or 'style' (variant gurudatta/sringeri).
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._templates = {}
+
+    def _compile(self, chapter, verse, kind, variant):
+        if kind == 'style':
+            url = self.catalog.url(chapter, verse, style=variant)
+            text = f"Playing full shloka of Chapter {chapter}, Verse {verse} in {variant} style"
+            name = f"Chapter {chapter} Verse {verse} Full"
+            description = f"Full Shloka in {variant} style"
+        else:
+            url = self.catalog.url(chapter, verse, quarter=variant)
+            text = f"Playing {variant} of Chapter {chapter}, Verse {verse}"
+            name = f"Chapter {chapter} Verse {verse} {variant}"
+            description = f"{variant} of Gita Shloka"
+        if url is None:
+            return None
+        payload = {
+            'google': {
+                'expectUserResponse': True,
+                'richResponse': {
+                    'items': [
+                        {
+                            'mediaResponse': {
+                                'mediaType': 'AUDIO',
+                                'mediaObjects': [
+                                    {
+                                        'name': name,
+                                        'description': description,
+                                        'contentUrl': url
+                                    }
+                                ]
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+        parameters = {'chapter': chapter, 'verse': verse, kind: variant}
+        prefix = (b'{"fulfillmentText":' + json_dumps(text) + b',"payload":' + json_dumps(payload)
+                  + b',"outputContexts":[{"name":')
+        suffix = b',"lifespanCount":5,"parameters":' + json_dumps(parameters) + b'}]}'
+        return prefix, suffix
+
+    def render(self, session, chapter, verse, kind, variant):
+        """Response body for a verse, or None if it has no such audio."""
+        key = (chapter, verse, kind, variant)
+        template = self._templates.get(key)
+        if template is None:
+            if key not in self._templates:
+                template = self._templates[key] = self._compile(*key)
+            if template is None:
+                return None
+        prefix, suffix = template
+        return prefix + json_dumps(f"{session}/contexts/shloka-context") + suffix
+
+
+response_templates = ResponseTemplates(audio_catalog)
+
+def json_response(body):
+    return Response(body, mimetype='application/json')
+
+def text_response(text):
+    return json_response(json_dumps({'fulfillmentText': text}))
+
+def media_response(session, chapter, verse, quarter=None, style=None):
+    """Media response for a verse, or None if its audio is missing."""
+    if (chapter, verse) not in audio_catalog.urls:
+        print(f"Error: No audio entry for {chapter}.{verse}")
         return None
-    
-    entry = audio_index[key]
     if quarter:
-        if quarter == 'pada1':
-            return f"{AUDIO_BASE_URL}{entry['quarter']}"
-        elif quarter == 'pada3':
-            # Assume third quarter is same as first with '3' suffix
-            quarter_path = entry['quarter'].replace('.mp3', '3.mp3')
-            return f"{AUDIO_BASE_URL}{quarter_path}"
+        body = response_templates.render(session, chapter, verse, 'quarter', quarter)
     elif style:
-        if style == 'gurudatta':
-            return f"{AUDIO_BASE_URL}{entry['full']}"
-        elif style == 'sringeri':
-            # Assume Sringeri style replaces .mp3 with .mp4
-            sringeri_path = entry['full'].replace('.mp3', '.mp4').replace('AudioFull', 'AudioFullSringeri')
-            return f"{AUDIO_BASE_URL}{sringeri_path}"
-    return None
+        body = response_templates.render(session, chapter, verse, 'style', style)
+    else:
+        body = None
+    return json_response(body) if body is not None else None
+
+# Whole-chapter recordings for continuous play
+parayana = ParayanaLibrary()
+
+def stream_url(style, chapter, first=None, last=None):
+    base = PUBLIC_BASE_URL or request.host_url
+    url = f"{base.rstrip('/')}/parayana/{style}/{chapter}"
+    if first or last:
+        url += f"?from={first or 1}" + (f"&to={last}" if last else "")
+    return url
+
+def use_parayana_full_audio(catalog):
+    """Point full-shloka URLs at verse slices of the chapter recordings where they cover the whole chapter."""
+    for style, variant in (('sgs', 'gurudatta'), ('sringeri', 'sringeri')):
+        for chapter in parayana.chapters(style):
+            verses = parayana.verse_count(style, chapter)
+            if verses != catalog.max_verses(chapter):
+                continue
+            for verse in range(1, verses + 1):
+                urls = catalog.urls.get((chapter, verse))
+                if urls:
+                    urls[variant] = stream_url(style, chapter, verse, verse)
+
+if PARAYANA_FULL_AUDIO and PUBLIC_BASE_URL:
+    use_parayana_full_audio(audio_catalog)
+
+def continuous_response(session, style, chapter, first=None, last=None):
+    text = f"Playing Chapter {chapter} continuously in {style} style"
+    if first or last:
+        text += f" from verse {first or 1}" + (f" to verse {last}" if last else "")
+    response = {
+        'fulfillmentText': text,
+        'payload': {
+            'google': {
+                'expectUserResponse': True,
+                'richResponse': {
+                    'items': [
+                        {
+                            'mediaResponse': {
+                                'mediaType': 'AUDIO',
+                                'mediaObjects': [
+                                    {
+                                        'name': f"Chapter {chapter} Parayana",
+                                        'description': f"Continuous play in {style} style",
+                                        'contentUrl': stream_url(style, chapter, first, last)
+                                    }
+                                ]
+                            }
+                        }
+                    ]
+                }
+            }
+        },
+        'outputContexts': [
+            {
+                'name': f"{session}/contexts/shloka-context",
+                'lifespanCount': 5,
+                'parameters': {
+                    'chapter': chapter,
+                    'verse': first or 1,
+                    'style': style
+                }
+            }
+        ]
+    }
+    return json_response(json_dumps(response))
+
+def shloka_context(req):
+    context = next((ctx for ctx in req.get('queryResult', {}).get('outputContexts', []) if 'shloka-context' in ctx.get('name', '')), None)
+    return context.get('parameters', {}) if context else {}
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    req = request.get_json(silent=True, force=True)
+    try:
+        req = json_loads(request.get_data())
+    except ValueError:
+        req = None
+    if not isinstance(req, dict):
+        req = {}
     intent_name = req.get('queryResult', {}).get('intent', {}).get('displayName', '')
     parameters = req.get('queryResult', {}).get('parameters', {})
     session = req.get('session', '')
 
-    response = {'fulfillmentText': 'Processing request...'}
-
     # Handle ZeroIntent (Get Random Shloka Q1 or Q1/Q3)
     if intent_name == 'ZeroIntent':
         quarter = parameters.get('quarter', 'pada1')
@@ -65,153 +267,34 @@ def webhook():
         max_verses = get_max_verses(chapter)
         verse = random.randint(1, max_verses)
         
-        audio_url = get_audio_url(chapter, verse, quarter)
-        if audio_url:
-            response['fulfillmentText'] = f"Playing {quarter} of Chapter {chapter}, Verse {verse}"
-            response['payload'] = {
-                'google': {
-                    'expectUserResponse': True,
-                    'richResponse': {
-                        'items': [
-                            {
-                                'mediaResponse': {
-                                    'mediaType': 'AUDIO',
-                                    'mediaObjects': [
-                                        {
-                                            'name': f"Chapter {chapter} Verse {verse} {quarter}",
-                                            'description': f"{quarter} of Gita Shloka",
-                                            'contentUrl': audio_url
-                                        }
-                                    ]
-                                }
-                            }
-                        ]
-                    }
-                }
-            }
-            response['outputContexts'] = [
-                {
-                    'name': f"{session}/contexts/shloka-context",
-                    'lifespanCount': 5,
-                    'parameters': {
-                        'chapter': chapter,
-                        'verse': verse,
-                        'quarter': quarter
-                    }
-                }
-            ]
-        else:
-            response['fulfillmentText'] = f"Sorry, audio not found for Chapter {chapter}, Verse {verse}."
+        return (media_response(session, chapter, verse, quarter)
+                or text_response(f"Sorry, audio not found for Chapter {chapter}, Verse {verse}."))
 
     # Handle FullIntent (Get Full Shloka)
     elif intent_name == 'FullIntent':
         style = parameters.get('style', 'gurudatta')
-        context = next((ctx for ctx in req.get('queryResult', {}).get('outputContexts', []) if 'shloka-context' in ctx.get('name', '')), None)
-        context_params = context.get('parameters', {}) if context else {}
+        context_params = shloka_context(req)
         
         if not context_params or not context_params.get('chapter') or not context_params.get('verse'):
-            response['fulfillmentText'] = "Please select a shloka first"
-        else:
-            current_chapter = int(context_params['chapter'])
-            current_verse = int(context_params['verse'])
-            audio_url = get_audio_url(current_chapter, current_verse, style=style)
-            if audio_url:
-                response['fulfillmentText'] = f"Playing full shloka of Chapter {current_chapter}, Verse {current_verse} in {style} style"
-                response['payload'] = {
-                    'google': {
-                        'expectUserResponse': True,
-                        'richResponse': {
-                            'items': [
-                                {
-                                    'mediaResponse': {
-                                        'mediaType': 'AUDIO',
-                                        'mediaObjects': [
-                                            {
-                                                'name': f"Chapter {current_chapter} Verse {current_verse} Full",
-                                                'description': f"Full Shloka in {style} style",
-                                                'contentUrl': audio_url
-                                            }
-                                        ]
-                                    }
-                                }
-                            ]
-                        }
-                    }
-                }
-                response['outputContexts'] = [
-                    {
-                        'name': f"{session}/contexts/shloka-context",
-                        'lifespanCount': 5,
-                        'parameters': {
-                            'chapter': current_chapter,
-                            'verse': current_verse,
-                            'style': style
-                        }
-                    }
-                ]
-            else:
-                response['fulfillmentText'] = f"Sorry, full shloka audio not found for Chapter {current_chapter}, Verse {current_verse}."
+            return text_response("Please select a shloka first")
+        current_chapter = int(context_params['chapter'])
+        current_verse = int(context_params['verse'])
+        return (media_response(session, current_chapter, current_verse, style=style)
+                or text_response(f"Sorry, full shloka audio not found for Chapter {current_chapter}, Verse {current_verse}."))
 
     # Handle NextIntent (Get Next Shloka)
     elif intent_name == 'NextIntent':
-        context = next((ctx for ctx in req.get('queryResult', {}).get('outputContexts', []) if 'shloka-context' in ctx.get('name', '')), None)
-        context_params = context.get('parameters', {}) if context else {}
+        context_params = shloka_context(req)
         
         if not context_params or not context_params.get('chapter') or not context_params.get('verse'):
-            response['fulfillmentText'] = "Please select a shloka first"
-        else:
-            current_chapter = int(context_params['chapter'])
-            current_verse = int(context_params['verse'])
-            current_quarter = context_params.get('quarter', 'pada1')
-            
-            max_verses = get_max_verses(current_chapter)
-            next_verse = current_verse + 1
-            next_chapter = current_chapter
-            
-            if next_verse > max_verses:
-                next_verse = 1
-                next_chapter = current_chapter % 18 + 1
-                max_verses = get_max_verses(next_chapter)
-                if next_verse > max_verses:
-                    next_verse = 1
-            
-            audio_url = get_audio_url(next_chapter, next_verse, current_quarter)
-            if audio_url:
-                response['fulfillmentText'] = f"Playing {current_quarter} of Chapter {next_chapter}, Verse {next_verse}"
-                response['payload'] = {
-                    'google': {
-                        'expectUserResponse': True,
-                        'richResponse': {
-                            'items': [
-                                {
-                                    'mediaResponse': {
-                                        'mediaType': 'AUDIO',
-                                        'mediaObjects': [
-                                            {
-                                                'name': f"Chapter {next_chapter} Verse {next_verse} {current_quarter}",
-                                                'description': f"{current_quarter} of Gita Shloka",
-                                                'contentUrl': audio_url
-                                            }
-                                        ]
-                                    }
-                                }
-                            ]
-                        }
-                    }
-                }
-                response['outputContexts'] = [
-                    {
-                        'name': f"{session}/contexts/shloka-context",
-                        'lifespanCount': 5,
-                        'parameters': {
-                            'chapter': next_chapter,
-                            'verse': next_verse,
-                            'quarter': current_quarter
-                        }
-                    }
-                ]
-            else:
-                response['fulfillmentText'] = f"Sorry, next shloka audio not found for Chapter {next_chapter}, Verse {next_verse}."
+            return text_response("Please select a shloka first")
+        current_chapter = int(context_params['chapter'])
+        current_verse = int(context_params['verse'])
+        current_quarter = context_params.get('quarter', 'pada1')
+        next_chapter, next_verse = audio_catalog.next_verse(current_chapter, current_verse)
+        
+        return (media_response(session, next_chapter, next_verse, current_quarter)
+                or text_response(f"Sorry, next shloka audio not found for Chapter {next_chapter}, Verse {next_verse}."))
 
     # Handle ChapterIntent (Select Chapter)
     elif intent_name == 'ChapterIntent':
@@ -222,47 +305,57 @@ def webhook():
         max_verses = get_max_verses(chapter)
         verse = random.randint(1, max_verses)
         
-        audio_url = get_audio_url(chapter, verse, quarter)
-        if audio_url:
-            response['fulfillmentText'] = f"Playing {quarter} of Chapter {chapter}, Verse {verse}"
-            response['payload'] = {
-                'google': {
-                    'expectUserResponse': True,
-                    'richResponse': {
-                        'items': [
-                            {
-                                'mediaResponse': {
-                                    'mediaType': 'AUDIO',
-                                    'mediaObjects': [
-                                        {
-                                            'name': f"Chapter {chapter} Verse {verse} {quarter}",
-                                            'description': f"{quarter} of Gita Shloka",
-                                            'contentUrl': audio_url
-                                        }
-                                    ]
-                                }
-                            }
-                        ]
-                    }
-                }
-            }
-            response['outputContexts'] = [
-                {
-                    'name': f"{session}/contexts/shloka-context",
-                    'lifespanCount': 5,
-                    'parameters': {
-                        'chapter': chapter,
-                        'verse': verse,
-                        'quarter': quarter
-                    }
-                }
-            ]
-        else:
-            response['fulfillmentText'] = f"Sorry, audio not found for Chapter {chapter}, Verse {verse}."
+        return (media_response(session, chapter, verse, quarter)
+                or text_response(f"Sorry, audio not found for Chapter {chapter}, Verse {verse}."))
+
+    # Handle ContinuousIntent (Play a chapter, or a verse range of it, from the parayana recording)
+    elif intent_name == 'ContinuousIntent':
+        chapter = int(parameters.get('chapter', 1))
+        style = parameters.get('style', 'gurudatta')
+        # The full-shloka styles map onto the two parayana recordings
+        style = 'sringeri' if style == 'sringeri' else 'sgs'
+        first = int(parameters['from']) if parameters.get('from') else None
+        last = int(parameters['to']) if parameters.get('to') else None
+        if not parayana.has_chapter(style, chapter):
+            available = ', '.join(str(c) for c in parayana.chapters(style))
+            return text_response(f"Sorry, continuous play of Chapter {chapter} is not available in {style} style. Available chapters: {available}.")
+        try:
+            parayana.span(style, chapter, first, last)
+        except ValueError as e:
+            return text_response(f"Sorry, {e}.")
+        return continuous_response(session, style, chapter, first, last)
 
-    return jsonify(response)
+    return text_response('Processing request...')
+
+@app.route('/parayana/<style>/<int:chapter>', methods=['GET', 'HEAD'])
+def parayana_stream(style, chapter):
+    """Stream a chapter recording, or the verses from..to of it, with HTTP Range support."""
+    first = request.args.get('from', type=int)
+    last = request.args.get('to', type=int)
+    try:
+        span = parayana.open_span(style, chapter, first, last)
+    except KeyError:
+        return Response("Not found", 404)
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    size = len(span)
+    headers = {'Accept-Ranges': 'bytes', 'Cache-Control': 'public, max-age=86400'}
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        return Response(status=416, headers={**headers, 'Content-Range': f"bytes */{size}"})
+    status = 200
+    if byte_range is not None:
+        status = 206
+        headers['Content-Range'] = f"bytes {byte_range[0]}-{byte_range[1] - 1}/{size}"
+        span = span.slice(*byte_range)
+    headers['Content-Length'] = str(len(span))
+
+    # The span is read from the shared memory map, or sent with sendfile where the server supports it
+    body = wrap_file(request.environ, span, STREAM_CHUNK_SIZE)
+    return Response(body, status, headers=headers, mimetype='audio/mpeg', direct_passthrough=True)
 
 if __name__ == '__main__':
     print(f"Starting Flask on port {os.environ.get('PORT', 8080)}")
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
-
@@ -0,0 +1,339 @@
+"""Offline load-replay benchmark for the bot's message handler.
+
+Synthetic users send a mix of the documented commands through the real
+``handle_message``. Updates are built with ``Update.de_json`` against a
+``RecordingBot`` that counts every send instead of calling Telegram. The
+report gives throughput and p50/p95/p99 latency per command branch, plus
+the memory taken by the session store as simulated users pile up, and the
+command parser's time against the if-chain it replaced over the documented
+commands (the cases of ``gita_command_cases.py``). The report is written as
+JSON so runs can be compared:
+
+    python bench_handlers.py --updates 20000 --output bench.json
+    python bench_handlers.py --session-users 1000000 --compare bench.json
+
+Sessions live in memory, audio handles in a temporary SQLite file, and the
+send rate limits are lifted, so only the bot's own work is measured.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("BOT_STATE_DB", os.path.join(tempfile.mkdtemp(prefix="gita-bench-"), "bot_state.db"))
+os.environ.setdefault("MEANINGS_REFRESH_TTL", "0")
+for name, value in (("CHAT_SEND_RATE", "1e9"), ("CHAT_SEND_BURST", "1000000"), ("GLOBAL_SEND_RATE", "1e9")):
+    os.environ.setdefault(name, value)
+
+from telegram import Audio, Bot, Chat, Message, Update, Voice  # noqa: E402
+
+import Bhagavad_Gita_Bot as gita_bot  # noqa: E402
+from gita_command_cases import PARSER_CASES  # noqa: E402
+from gita_commands import parse  # noqa: E402
+from gita_review import GRADES  # noqa: E402
+from gita_sessions import MemorySessionBackend, encode_session  # noqa: E402
+from gita_translit import is_indic, is_syllable, to_telugu_block, transliterate  # noqa: E402
+
+# Command branches and their share of the replayed traffic
+WORKLOAD = {
+    "random": 30,
+    "specific": 20,
+    "search": 12,
+    "n5": 10,
+    "p": 10,
+    "mn": 10,
+    "f": 4,
+    "o": 4,
+}
+SEARCH_TERMS = ("a", "ka", "ba", "sa", "ya", "ma", "na", "dharma", "karma", "yo")
+AUDIO_SUFFIXES = ("", "", "", "a", "ao")
+
+
+# The string work of the if-chain that handle_message used before gita_commands, up to the choice of branch
+def legacy_branch(text):
+    original_text = text.strip().lower()
+    command, _, term = text.strip().partition(" ")
+    if command.lower() in ("find", "define"):
+        return command.lower()
+    if original_text in GRADES:
+        return "grade"
+    audio_only = original_text.endswith("ao")
+    with_audio = original_text.endswith("a") and not audio_only and not is_syllable(original_text)
+    base_command = original_text[:-2] if audio_only else original_text[:-1] if with_audio else original_text
+    if "." in base_command:
+        chapter, verse = base_command.split(".", 1)
+        if chapter.isdigit() and verse.isdigit():
+            return "specific"
+    if base_command.isdigit():
+        return "number"
+    query = text.strip()
+    if is_indic(query):
+        return "search", to_telugu_block(query)
+    if all(word.isalpha() for word in query.split()) and base_command not in {"f", "p", "o", "r", "mn", "more", "all"}:
+        return "search", transliterate(query, prefix=True)
+    if base_command in ("more", "all"):
+        return base_command
+    if base_command == "mn" or base_command.startswith("mn "):
+        return "mn", base_command.split()
+    if base_command == "f":
+        return "f"
+    if base_command.startswith("n") and base_command[1:].isdigit():
+        return "n"
+    if base_command in ("p", "r", "o"):
+        return base_command
+    practice, _, chapter = base_command.partition(" ")
+    if practice in ("q", "q1", "q3") and (not chapter or chapter.isdigit()):
+        return "practice"
+    return "invalid"
+
+
+# The parser followed by the search prefix lookup that search messages still need
+def compiled_branch(text):
+    command = parse(text)
+    if command.kind == "search":
+        return command, gita_bot.get_search_prefix(command.args[0])
+    return command
+
+
+# Time the legacy if-chain and the parser over the PARSER_CASES inputs
+def parser_speed(rounds):
+    texts = [text for text, _ in PARSER_CASES]
+    timings = {}
+    for name, function in (("legacy", legacy_branch), ("parser", compiled_branch)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for text in texts:
+                function(text)
+        timings[f"{name}_us"] = round((time.perf_counter() - started) / (rounds * len(texts)) * 1e6, 3)
+    timings["speedup"] = round(timings["legacy_us"] / timings["parser_us"], 2)
+    return timings
+
+
+class RecordingBot(Bot):
+    """Bot whose send methods count the call and return a plausible Message instead of calling Telegram."""
+
+    def __init__(self):
+        super().__init__(os.environ["TELEGRAM_BOT_TOKEN"])
+        # Bot objects are frozen once constructed
+        with self._unfrozen():
+            self.calls = Counter()
+            self._ids = itertools.count(1)
+
+    def _message(self, chat_id, **fields):
+        return Message(next(self._ids), datetime.now(timezone.utc), Chat(chat_id, Chat.PRIVATE), **fields)
+
+    def _audio(self, audio):
+        file_id = audio if isinstance(audio, str) and not audio.startswith("http") else f"bench-{next(self._ids)}"
+        return Audio(file_id, file_id, 30)
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        self.calls["send_message"] += 1
+        return self._message(chat_id, text=text)
+
+    async def send_audio(self, chat_id, audio, *args, **kwargs):
+        self.calls["send_audio"] += 1
+        return self._message(chat_id, audio=self._audio(audio))
+
+    async def send_voice(self, chat_id, voice, *args, **kwargs):
+        self.calls["send_voice"] += 1
+        file_id = self._audio(voice).file_id
+        return self._message(chat_id, voice=Voice(file_id, file_id, 30))
+
+    async def send_media_group(self, chat_id, media, *args, **kwargs):
+        self.calls["send_media_group"] += 1
+        return tuple(self._message(chat_id, audio=self._audio(item.media)) for item in media)
+
+
+def make_update(bot, update_id, user_id, text):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }, bot)
+
+
+# Endless (user_id, branch, text) stream. Every user starts with a random draw so that n5, p, mn, f and o
+# have a verse to work from, and a search is followed by 'more' or 'all' from the same user.
+def workload(users, rng):
+    verses = gita_bot.verse_table.verses
+    branches, weights = zip(*WORKLOAD.items())
+    started = set()
+    follow_up = {}
+    while True:
+        user_id = rng.randrange(1, users + 1)
+        if user_id in follow_up:
+            branch = follow_up.pop(user_id)
+            yield user_id, branch, branch
+            continue
+        branch = rng.choices(branches, weights)[0] if user_id in started else "random"
+        started.add(user_id)
+        if branch == "random":
+            text = f"{rng.randrange(0, 19)}{rng.choice(AUDIO_SUFFIXES)}"
+        elif branch == "specific":
+            text = "{}.{}{}".format(*rng.choice(verses), rng.choice(AUDIO_SUFFIXES))
+        elif branch == "search":
+            text = rng.choice(SEARCH_TERMS)
+            follow_up[user_id] = rng.choice(("more", "all"))
+        else:
+            text = branch
+        yield user_id, branch, text
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 4),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+        "max_ms": round(samples[-1] * 1000, 4),
+    }
+
+
+async def replay(updates, users, seed):
+    bot = RecordingBot()
+    rng = random.Random(seed)
+    latencies = defaultdict(list)
+    stream = workload(users, rng)
+    started = time.perf_counter()
+    for update_id, (user_id, branch, text) in zip(range(1, updates + 1), stream):
+        update = make_update(bot, update_id, user_id, text)
+        begin = time.perf_counter()
+        await gita_bot.handle_message(update, None)
+        latencies[branch].append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - started
+    handled = sum(map(len, latencies.values()))
+    return {
+        "updates": handled,
+        "users": users,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(handled / elapsed, 1),
+        "overall": summarize([value for values in latencies.values() for value in values]),
+        "branches": {branch: summarize(values) for branch, values in sorted(latencies.items())},
+        "telegram_calls": dict(bot.calls),
+    }
+
+
+# Memory held by a session store as users arrive, each making `draws` random draws
+def session_memory(users, draws, seed, checkpoints=10):
+    rng = random.Random(seed)
+    backend = MemorySessionBackend(max_sessions=users, ttl=365 * 24 * 3600)
+    chapters = gita_bot.verse_table.chapters
+    growth = []
+    step = max(1, users // checkpoints)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    for user_id in range(1, users + 1):
+        session = backend.get(user_id)
+        for _ in range(draws):
+            gita_bot.get_random_shloka(rng.choice(chapters), session)
+        backend.save(session)
+        if user_id % step == 0 or user_id == users:
+            growth.append({"users": user_id, "bytes": tracemalloc.get_traced_memory()[0] - baseline})
+    tracemalloc.stop()
+    sample = [backend.peek(rng.randrange(1, users + 1)) for _ in range(min(users, 1000))]
+    return {
+        "users": users,
+        "draws_per_user": draws,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "bytes": growth[-1]["bytes"],
+        "bytes_per_session": round(growth[-1]["bytes"] / users, 1),
+        "encoded_bytes_per_session": round(sum(len(encode_session(s)) for s in sample) / len(sample), 1),
+        "growth": growth,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print the p95 change of every branch and the throughput change against an earlier report
+def compare(report, baseline):
+    print(f"Compared with {baseline['meta'].get('revision')} ({baseline['meta'].get('timestamp')}):")
+    old, new = baseline["replay"], report["replay"]
+    if "parser" in baseline:
+        print(f"  parser     {baseline['parser']['parser_us']:>10.3f} → {report['parser']['parser_us']:>10.3f} µs")
+    print(f"  throughput {old['throughput_per_s']:>10.1f} → {new['throughput_per_s']:>10.1f} /s")
+    for branch, stats in new["branches"].items():
+        before = old["branches"].get(branch)
+        if before:
+            change = (stats["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+            print(f"  {branch:<10} p95 {before['p95_ms']:>8.3f} → {stats['p95_ms']:>8.3f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--updates", type=int, default=20000, help="updates to replay through handle_message")
+    parser.add_argument("--users", type=int, default=1000, help="distinct users in the replayed traffic")
+    parser.add_argument("--session-users", type=int, default=20000, help="users simulated for the session memory test")
+    parser.add_argument("--draws", type=int, default=5, help="random draws per simulated user")
+    parser.add_argument("--parser-rounds", type=int, default=2000, help="passes over the documented commands when timing the parser")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "workload": WORKLOAD,
+        },
+        "parser": parser_speed(args.parser_rounds),
+        "replay": asyncio.run(replay(args.updates, args.users, args.seed)),
+    }
+    if args.session_users:
+        report["sessions"] = session_memory(args.session_users, args.draws, args.seed)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    parsing = report["parser"]
+    print(f"✅ Parser: {parsing['parser_us']} µs per message vs {parsing['legacy_us']} µs for the old if-chain ({parsing['speedup']}x)")
+    replayed = report["replay"]
+    print(f"✅ {replayed['updates']} updates in {replayed['elapsed_s']}s ({replayed['throughput_per_s']}/s)")
+    for branch, stats in replayed["branches"].items():
+        print(f"  {branch:<10} n={stats['count']:<7} p50 {stats['p50_ms']:.3f}  p95 {stats['p95_ms']:.3f}  p99 {stats['p99_ms']:.3f} ms")
+    if "sessions" in report:
+        sessions = report["sessions"]
+        print(f"  sessions: {sessions['users']} users, {sessions['bytes_per_session']} bytes each in memory, "
+              f"{sessions['encoded_bytes_per_session']} encoded")
+    print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,49 @@
-import os
-import json
+"""Build gita_audio_index.json, the catalog of the bot's audio files.
+
+Every audio folder is scanned in parallel and each MP3 is recorded with its
+size, duration, bitrate and content hash (see ``gita_audio_catalog``). A
+rerun only reads files whose size or modification time changed since the
+last catalog; the modification times are kept next to it in an untracked
+``gita_audio_index.mtimes.json``, so a fresh checkout hashes every file once:
+
+    python generate_audio_index.py
+    python generate_audio_index.py --base-dir /path/to/bhagavad-gita-bot --full
+"""
+import argparse
+import sys
+import time
 from pathlib import Path
 
-# ✅ Adjust path to your folder location
-base_path = Path(r"C:\Users\91990\My Drive (dr.p.udayabhaskar@gmail.com)\Gita\GitHub\bhagavad-gita-bot")
-
-quarter_base_url = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/main/AudioQuarterAll"
-full_base_url = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/main/AudioFull"
-
-quarter_path = base_path / "AudioQuarterAll"
-entries = []
-
-for chapter_folder in quarter_path.glob("Chapter *"):
-    ch = int(chapter_folder.name.split(" ")[1])
-    for mp3_file in chapter_folder.glob("*.mp3"):
-        name = mp3_file.stem  # e.g., 1.1
-        parts = name.split(".")
-        if len(parts) != 2:
-            continue
-        ch_num, verse_num = parts
-        try:
-            ch_num = int(ch_num)
-            verse_num = int(verse_num)
-        except ValueError:
-            continue
-
-        # We'll mark this as quarter=1 or 3, alternating
-        # or randomly mark all as quarter 1 for safety
-        assumed_quarter = 1 if verse_num % 2 != 0 else 3
-
-        quarter_url = f"{quarter_base_url}/Chapter {ch}/{name}.mp3"
-        full_url = f"{full_base_url}/{ch}.{verse_num}.mp3"
-
-        entries.append({
-            "chapter": ch,
-            "verse": verse_num,
-            "quarter_part": assumed_quarter,
-            "quarter": quarter_url,
-            "full": full_url
-        })
-
-# Save it
-output_path = base_path / "gita_audio_index.json"
-with output_path.open("w", encoding="utf-8") as f:
-    json.dump(entries, f, indent=2)
-
-print(f"✅ Saved gita_audio_index.json with {len(entries)} entries.")
+from gita_audio_catalog import BASE_DIR, CATALOG_FILE, build_catalog, load_catalog, load_mtimes, save_catalog, save_mtimes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-dir", default=str(BASE_DIR), help="repository checkout holding the audio folders")
+    parser.add_argument("--output", default=CATALOG_FILE, help="catalog path, relative to the base directory")
+    parser.add_argument("--workers", type=int, help="parallel file readers")
+    parser.add_argument("--full", action="store_true", help="read every file again instead of reusing unchanged entries")
+    args = parser.parse_args()
+
+    base_dir = Path(args.base_dir)
+    output = base_dir / args.output
+    mtimes_path = output.with_suffix(".mtimes.json")
+    previous = None if args.full else load_catalog(output)
+    known_mtimes = {} if args.full else load_mtimes(mtimes_path)
+    started = time.perf_counter()
+    catalog, mtimes = build_catalog(base_dir, previous, args.workers, known_mtimes)
+    save_catalog(catalog, output)
+    save_mtimes(mtimes, mtimes_path)
+
+    files = catalog["files"]
+    # Files whose size and mtime were unchanged, and so were not read
+    reused = sum(entry is (previous or {}).get("files", {}).get(path) and known_mtimes.get(path) == mtimes[path]
+                 for path, entry in files.items())
+    print(f"✅ Catalogued {len(files)} audio files ({sum(entry['size'] for entry in files.values()) / 1e6:.1f} MB, "
+          f"{sum(entry['duration'] or 0 for entry in files.values()) / 3600:.1f} h) and {len(catalog['verses'])} verses "
+          f"in {time.perf_counter() - started:.1f}s; {len(files) - reused} files read")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
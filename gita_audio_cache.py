@@ -0,0 +1,240 @@
+"""Telegram ``file_id`` cache for the verse audio files.
+
+Telegram returns a ``file_id`` for every audio message it accepts. Sending
+that id again is instant, whereas sending a URL makes Telegram download the
+MP3 from GitHub every time. Handles are kept in memory and persisted to a
+small SQLite database so they survive restarts.
+
+When ``transcode_audio.py`` has written compact variants of the files,
+``AudioVariants`` picks the smallest one a client can play: an Opus voice
+note, a low-bitrate MP3, or the original. Each variant has its own handle.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from gita_io import run_blocking
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+AUDIO_BASE_URL = "https://raw.githubusercontent.com/pubsaroja/bhagavad-gita-bot/main/"
+
+# Audio sets and the repo-relative path of one file; pada is only used by the AQ4Paadas sets
+AUDIO_SETS = {
+    "AudioQuarter": "AudioQuarter/{chapter}.{verse}.mp3",
+    "AudioFullSGS": "AudioFullSGS/{chapter}.{verse}.mp3",
+    "AudioFullSringeri": "AudioFullSringeri/{chapter}.{verse}.mp3",
+    "AQ4PaadasSGS": "AQ4PaadasSGS/Chapter {chapter}/{verse}.{pada}.mp3",
+    "AQ4PaadasSringeri": "AQ4PaadasSringeri/Chapter {chapter}/{verse}.{pada}.mp3",
+}
+PADA_SETS = ("AQ4PaadasSGS", "AQ4PaadasSringeri")
+# Compact variants written by transcode_audio.py, and their manifest
+VARIANTS_DIR = "AudioCompact"
+VARIANTS_MANIFEST = "audio_variants.json"
+# Variants Telegram plays as voice notes; the others are sent as audio
+VOICE_VARIANTS = {"opus"}
+
+
+# Key identifying one audio file: (audio set, chapter, verse, pada); pada is 0 for whole-verse sets
+def audio_key(audio_set, chapter, verse, pada=0):
+    return (audio_set, int(chapter), int(verse), int(pada))
+
+
+def retry_after_seconds(error):
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+def audio_path(key):
+    audio_set, chapter, verse, pada = key
+    return AUDIO_SETS[audio_set].format(chapter=chapter, verse=verse, pada=pada)
+
+
+def file_url(path):
+    return f"{AUDIO_BASE_URL}{path}".replace(" ", "%20")
+
+
+def audio_url(key):
+    return file_url(audio_path(key))
+
+
+class AudioVariants:
+    """Smallest file per audio file path among the original and the variants a client can play."""
+
+    def __init__(self, manifest=None, formats=("opus", "mp3")):
+        # formats: variants clients can play, from transcode_audio.VARIANTS
+        self.formats = tuple(formats)
+        # audio path -> (path, variant) of the smallest file, any kind / audio only; variant None is the original
+        self._smallest = {}
+        self._smallest_audio = {}
+        files = {}
+        if manifest is not None:
+            try:
+                with open(manifest, encoding="utf-8") as f:
+                    files = json.load(f).get("files", {})
+            except FileNotFoundError:
+                logger.info(f"No audio variants manifest at {manifest}; sending the original MP3s")
+        for source, entry in files.items():
+            candidates = [(entry["size"], source, None)] + [
+                (variant["size"], variant["path"], name) for name, variant in entry["variants"].items() if name in self.formats
+            ]
+            self._smallest[source] = min(candidates, key=lambda candidate: candidate[0])[1:]
+            self._smallest_audio[source] = min(
+                (candidate for candidate in candidates if candidate[2] not in VOICE_VARIANTS), key=lambda candidate: candidate[0]
+            )[1:]
+        if files:
+            logger.info(f"Loaded compact variants of {len(files)} audio files ({', '.join(self.formats)})")
+
+    def __len__(self):
+        return len(self._smallest)
+
+    # (path, variant) of the file to send for an audio file path; voice=False keeps to files sent as audio
+    def choose(self, path, voice=True):
+        return (self._smallest if voice else self._smallest_audio).get(path, (path, None))
+
+
+class AudioHandleCache:
+    def __init__(self, path, variants=None):
+        self.path = str(path)
+        self.variants = variants or AudioVariants()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS audio_handles ("
+            "audio_set TEXT, chapter INTEGER, verse INTEGER, pada INTEGER, file_id TEXT NOT NULL, "
+            "PRIMARY KEY (audio_set, chapter, verse, pada))"
+        )
+        self._db.commit()
+        self._handles = {
+            (audio_set, chapter, verse, pada): file_id
+            for audio_set, chapter, verse, pada, file_id in self._db.execute("SELECT * FROM audio_handles")
+        }
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"Loaded {len(self._handles)} cached audio handles from {self.path}")
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, key):
+        return key in self._handles
+
+    def get(self, key):
+        file_id = self._handles.get(key)
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    def _execute(self, sql, params):
+        with self._lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+    # The in-memory map is updated at once; only the SQLite write differs between the sync and async variants
+    def _put(self, key, file_id):
+        if self._handles.get(key) == file_id:
+            return None
+        self._handles[key] = file_id
+        return "INSERT OR REPLACE INTO audio_handles VALUES (?, ?, ?, ?, ?)", (*key, file_id)
+
+    def _discard(self, key):
+        if self._handles.pop(key, None) is None:
+            return None
+        return "DELETE FROM audio_handles WHERE audio_set = ? AND chapter = ? AND verse = ? AND pada = ?", key
+
+    def put(self, key, file_id):
+        write = self._put(key, file_id)
+        if write:
+            self._execute(*write)
+
+    def discard(self, key):
+        write = self._discard(key)
+        if write:
+            self._execute(*write)
+
+    async def aput(self, key, file_id):
+        write = self._put(key, file_id)
+        if write:
+            await run_blocking(self._execute, *write)
+
+    async def adiscard(self, key):
+        write = self._discard(key)
+        if write:
+            await run_blocking(self._execute, *write)
+
+    # (handle key, repo path, sent as voice) of the file to send for key. A variant's handle key
+    # carries the variant in its audio set ("AudioFullSGS:opus"), so each variant keeps its own file_id.
+    def source(self, key, voice=True):
+        path, variant = self.variants.choose(audio_path(key), voice)
+        if variant is None:
+            return key, path, False
+        return (f"{key[0]}:{variant}", *key[1:]), path, variant in VOICE_VARIANTS
+
+    # Reply with the audio for key, reusing the cached file_id and recording it on first send
+    async def reply_audio(self, message, key):
+        handle_key, path, voice = self.source(key)
+        reply = message.reply_voice if voice else message.reply_audio
+        file_id = self.get(handle_key)
+        if file_id is not None:
+            try:
+                return await reply(file_id)
+            except BadRequest as e:
+                logger.warning(f"⚠️ Cached file_id for {handle_key} was rejected ({e}); sending by URL")
+                await self.adiscard(handle_key)
+        sent = await reply(file_url(path))
+        media = None if sent is None else sent.voice if voice else sent.audio
+        if media is not None:
+            await self.aput(handle_key, media.file_id)
+        return sent
+
+    # Upload every local file of the given sets that has no handle yet.
+    # Each upload is sent to chat_id and deleted again once its file_id is known.
+    async def warm_up(self, bot, chat_id, keys, concurrency=4, base_dir=BASE_DIR):
+        semaphore = asyncio.Semaphore(concurrency)
+        uploaded = failed = 0
+
+        async def upload(key):
+            nonlocal uploaded, failed
+            handle_key, path, voice = self.source(key)
+            if handle_key in self._handles:
+                return
+            path = Path(base_dir) / path
+            send = bot.send_voice if voice else bot.send_audio
+            async with semaphore:
+                while True:
+                    try:
+                        with path.open("rb") as f:
+                            sent = await send(chat_id, f, disable_notification=True)
+                        break
+                    except RetryAfter as e:
+                        await asyncio.sleep(retry_after_seconds(e))
+                    except (OSError, TelegramError) as e:
+                        logger.error(f"Failed to upload {path}: {e}")
+                        failed += 1
+                        return
+                await self.aput(handle_key, (sent.voice if voice else sent.audio).file_id)
+                uploaded += 1
+                try:
+                    await sent.delete()
+                except TelegramError:
+                    pass
+
+        await asyncio.gather(*(upload(key) for key in keys))
+        return uploaded, failed
+
+
+# Every key of the given audio sets for the verses in verse_table
+def all_audio_keys(verse_table, audio_sets=tuple(AUDIO_SETS)):
+    for audio_set in audio_sets:
+        padas = (1, 2, 3, 4) if audio_set in PADA_SETS else (0,)
+        for chapter, verse in verse_table.verses:
+            for pada in padas:
+                yield audio_key(audio_set, chapter, verse, pada)
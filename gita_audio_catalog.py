@@ -0,0 +1,149 @@
+"""Catalog of the audio files shipped with the bot.
+
+``gita_audio_index.json`` lists every MP3 of the audio folders with its
+size, SHA-256, duration and bitrate, and indexes the per-verse files by
+``"chapter.verse"``. ``generate_audio_index.py`` builds it: folders are
+scanned and files probed in parallel, and a rebuild only re-reads files
+whose size or mtime changed (and only re-probes those whose hash changed).
+Modification times belong to one checkout, so they are kept out of the
+committed catalog in an untracked sidecar, ``gita_audio_index.mtimes.json``;
+without it every file is hashed once and the catalog comes out unchanged.
+The bot and the Dialogflow app load the catalog at startup instead of
+walking the folders.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from gita_audio_cache import AUDIO_SETS
+from gita_parayana import PARAYANA_STYLES, Mp3Layout
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+CATALOG_FILE = "gita_audio_index.json"
+CATALOG_VERSION = 3
+# Path -> mtime_ns of the files as last catalogued in this checkout
+MTIMES_FILE = "gita_audio_index.mtimes.json"
+# Per-verse file sets and their repo-relative paths (see gita_audio_cache.AUDIO_SETS)
+VERSE_SETS = {**AUDIO_SETS, "Explanation": "Explanation/{chapter}.{verse}.mp3"}
+# Every folder holding audio: the per-verse sets and the whole-chapter parayana recordings
+AUDIO_DIRS = (*dict.fromkeys(pattern.split("/", 1)[0] for pattern in VERSE_SETS.values()),
+              *(folder for folder, _ in PARAYANA_STYLES.values()))
+
+
+def _path_pattern(pattern):
+    regex = re.escape(pattern)
+    for field in ("chapter", "verse", "pada"):
+        regex = regex.replace(re.escape("{" + field + "}"), rf"(?P<{field}>\d+)")
+    return re.compile(regex)
+
+
+_VERSE_PATHS = [(audio_set, _path_pattern(pattern)) for audio_set, pattern in VERSE_SETS.items()]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Catalog entry and mtime_ns of one file. previous is its entry in the last catalog and mtime_ns
+# the mtime it had then: the file is only read again if its size or mtime changed, and only
+# probed again if its content did.
+def describe(base_dir, path, previous=None, mtime_ns=None):
+    stat = (Path(base_dir) / path).stat()
+    if previous and previous["size"] == stat.st_size and mtime_ns == stat.st_mtime_ns:
+        return previous, stat.st_mtime_ns
+    digest = file_hash(Path(base_dir) / path)
+    if previous and previous["sha256"] == digest:
+        return previous, stat.st_mtime_ns
+    entry = {"size": stat.st_size, "sha256": digest, "duration": None, "bitrate": None}
+    try:
+        layout = Mp3Layout(Path(base_dir) / path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Could not read {path}: {e}")
+        return entry, stat.st_mtime_ns
+    entry["duration"] = round(layout.duration, 3)
+    # Average bitrate in kbps, so VBR files are measured by what they hold
+    entry["bitrate"] = round((layout.audio_end - layout.audio_start) * 8 / layout.duration / 1000) if layout.duration else None
+    return entry, stat.st_mtime_ns
+
+
+def _scan(base_dir, folder):
+    root = Path(base_dir) / folder
+    return [path.relative_to(base_dir).as_posix() for path in root.rglob("*.mp3")] if root.is_dir() else []
+
+
+# "chapter.verse" -> {"chapter", "verse", audio set -> path, pada set -> [path of padas 1-4, None if missing]}
+def index_verses(paths):
+    verses = {}
+    for path in paths:
+        for audio_set, regex in _VERSE_PATHS:
+            match = regex.fullmatch(path)
+            if match is None:
+                continue
+            chapter, verse = int(match["chapter"]), int(match["verse"])
+            entry = verses.setdefault(f"{chapter}.{verse}", {"chapter": chapter, "verse": verse})
+            if "pada" in regex.groupindex:
+                pada = int(match["pada"])
+                if 1 <= pada <= 4:
+                    entry.setdefault(audio_set, [None] * 4)[pada - 1] = path
+            else:
+                entry[audio_set] = path
+            break
+    return dict(sorted(verses.items(), key=lambda item: (item[1]["chapter"], item[1]["verse"])))
+
+
+# Catalog of every audio file under base_dir, reusing the unchanged entries of previous, and
+# the mtimes of the files. mtimes are those of the files when previous was built.
+def build_catalog(base_dir=BASE_DIR, previous=None, workers=None, mtimes=None):
+    known = (previous or {}).get("files", {})
+    mtimes = mtimes or {}
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        paths = sorted(path for found in pool.map(lambda folder: _scan(base_dir, folder), AUDIO_DIRS) for path in found)
+        described = list(pool.map(lambda path: describe(base_dir, path, known.get(path), mtimes.get(path)), paths))
+    files = {path: entry for path, (entry, _) in zip(paths, described)}
+    catalog = {"version": CATALOG_VERSION, "files": files, "verses": index_verses(files)}
+    return catalog, {path: mtime_ns for path, (_, mtime_ns) in zip(paths, described)}
+
+
+def load_catalog(path=BASE_DIR / CATALOG_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            catalog = json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"⚠️ Audio catalog {path} not found; run generate_audio_index.py")
+        return {"version": CATALOG_VERSION, "files": {}, "verses": {}}
+    if catalog.get("version") != CATALOG_VERSION:
+        logger.warning(f"⚠️ Audio catalog {path} has an old format; run generate_audio_index.py")
+        return {"version": CATALOG_VERSION, "files": {}, "verses": {}}
+    return catalog
+
+
+def save_catalog(catalog, path=BASE_DIR / CATALOG_FILE):
+    partial = f"{path}.part"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(partial, path)
+
+
+def load_mtimes(path=BASE_DIR / MTIMES_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_mtimes(mtimes, path=BASE_DIR / MTIMES_FILE):
+    partial = f"{path}.part"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(mtimes, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(partial, path)
@@ -0,0 +1,58 @@
+"""Documented commands and the ``Command`` each parses to.
+
+Shared by ``test_gita_commands.py`` and ``bench_handlers.py``.
+"""
+from gita_commands import Command
+
+# Every command documented in /start, plus searches that look like commands, and the command parsed from each
+PARSER_CASES = (
+    ("a", Command("search", ("a",))),
+    ("ba", Command("search", ("ba",))),
+    ("dharmakshetre", Command("search", ("dharmakshetre",))),
+    ("yada yada", Command("search", ("yada yada",))),
+    ("more", Command("more")),
+    ("all", Command("all")),
+    ("1", Command("number", (1,))),
+    ("10", Command("number", (10,))),
+    ("0", Command("number", (0,))),
+    ("18", Command("number", (18,))),
+    ("0a", Command("number", (0,), "a")),
+    ("0ao", Command("number", (0,), "ao")),
+    ("18.1", Command("specific", ("18", "1"))),
+    ("18.1a", Command("specific", ("18", "1"), "a")),
+    ("18.1ao", Command("specific", ("18", "1"), "ao")),
+    ("f", Command("f")),
+    ("fa", Command("f", (), "a")),
+    ("fao", Command("f", (), "ao")),
+    ("n1", Command("n", (1,))),
+    ("n1a", Command("n", (1,), "a")),
+    ("n1ao", Command("n", (1,), "ao")),
+    ("n2", Command("n", (2,))),
+    ("n5", Command("n", (5,))),
+    ("p", Command("p")),
+    ("pa", Command("p", (), "a")),
+    ("pao", Command("p", (), "ao")),
+    ("mn", Command("mn", (None,))),
+    ("mn 1.1", Command("mn", ("1.1",))),
+    ("o", Command("o")),
+    ("q", Command("practice", ("q", None))),
+    ("q1", Command("practice", ("q1", None))),
+    ("q3", Command("practice", ("q3", None))),
+    ("q1 2", Command("practice", ("q1", "2"))),
+    ("q1 2a", Command("practice", ("q1", "2"), "a")),
+    ("again", Command("grade", ("again",))),
+    ("hard", Command("grade", ("hard",))),
+    ("good", Command("grade", ("good",))),
+    ("easy", Command("grade", ("easy",))),
+    ("r", Command("review")),
+    ("ra", Command("search", ("ra",))),
+    ("find karma", Command("find", ("karma",))),
+    ("define yuyutsavah", Command("define", ("yuyutsavah",))),
+    ("Find Karma", Command("find", ("Karma",))),
+    ("  18.1A ", Command("specific", ("18", "1"), "a")),
+    ("Q1 0", Command("practice", ("q1", None))),
+    ("dharma", Command("search", ("dharma",))),
+    ("mna", Command("mn", (None,), "a")),
+    ("nava", Command("search", ("nava",))),
+    ("ధర్మ", Command("search", ("ధర్మ",))),
+)
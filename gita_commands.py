@@ -0,0 +1,92 @@
+"""Parser for the text commands users send the bot.
+
+``parse`` turns a message into a ``Command``: its kind, its arguments and
+the audio suffix (``a`` for audio with the text, ``ao`` for audio only).
+The whole grammar is one compiled regular expression matched once over the
+message, so parsing is a single O(len(text)) pass. Only command forms take
+the audio suffix, which keeps searches such as ``ba`` or ``dharma`` from
+losing their last letter. Messages that are not commands become searches.
+What a bare number means (a random shloka or a search result) depends on
+the session, so it is left to the handler.
+"""
+import re
+
+# Audio suffixes
+WITH_AUDIO = "a"
+AUDIO_ONLY = "ao"
+
+# Numbers are capped at four digits, longer ones are not commands
+_GRAMMAR = re.compile(r"""
+    (?P<word>find|define)(?:\s+(?P<term>.*))?
+  | (?P<grade>again|hard|good|easy)
+  | (?P<page>more|all)
+  | (?P<review>r)
+  | (?:
+        (?P<chapter>[0-9]{1,4})\.(?P<verse>[0-9]{1,4})
+      | (?P<number>[0-9]{1,4})
+      | n(?P<count>[0-9]{1,4})
+      | (?P<practice>q[13]?)(?:\s+(?P<practice_chapter>[0-9]{1,4}))?
+      | mn(?:\s+(?P<shloka_id>[0-9][0-9.]*?))?
+      | (?P<letter>[fpo])
+    )(?P<audio>ao|a)?
+""", re.VERBOSE | re.DOTALL)
+
+# Single-letter commands that take the audio suffix, and their kinds. 'r' takes none, so 'ra' stays a search.
+_LETTERS = {"f": "f", "p": "p", "o": "o"}
+
+
+class Command:
+    __slots__ = ("kind", "args", "audio")
+
+    def __init__(self, kind, args=(), audio=""):
+        self.kind = kind
+        self.args = args
+        self.audio = audio
+
+    @property
+    def with_audio(self):
+        return self.audio == WITH_AUDIO
+
+    @property
+    def audio_only(self):
+        return self.audio == AUDIO_ONLY
+
+    def __eq__(self, other):
+        return isinstance(other, Command) and (self.kind, self.args, self.audio) == (other.kind, other.args, other.audio)
+
+    def __repr__(self):
+        return f"Command({self.kind!r}, {self.args!r}, {self.audio!r})"
+
+
+# Command of a message. Kinds and their args:
+#   find / define (term)       grade (grade word)          more / all ()
+#   specific (chapter, verse)  number (number)             n (count)
+#   practice (command, chapter or None)                    mn (shloka id or None)
+#   f / p / o / review ()      search (text)
+def parse(text):
+    text = text.strip()
+    match = _GRAMMAR.fullmatch(text.lower())
+    if match is None:
+        return Command("search", (text,))
+    word, term, grade, page, review, chapter, verse, number, count, practice, practice_chapter, shloka_id, letter, audio = match.groups()
+    if word:
+        # The term keeps its case
+        return Command(word, (text[len(word):].strip() if term else "",))
+    if grade:
+        return Command("grade", (grade,))
+    if page:
+        return Command(page)
+    if review:
+        return Command("review")
+    audio = audio or ""
+    if chapter:
+        return Command("specific", (str(int(chapter)), str(int(verse))), audio)
+    if number:
+        return Command("number", (int(number),), audio)
+    if count:
+        return Command("n", (int(count),), audio)
+    if practice:
+        return Command("practice", (practice, str(int(practice_chapter)) if practice_chapter and int(practice_chapter) else None), audio)
+    if letter:
+        return Command(_LETTERS[letter], (), audio)
+    return Command("mn", (shloka_id,), audio)
@@ -0,0 +1,363 @@
+"""Pre-compiled shloka corpus.
+
+The ``BG *.txt`` files shipped with the repo are parsed once into
+``gita_corpus.bin`` so the bot can start without any network access.
+Rebuild it after editing the text files with::
+
+    python gita_corpus.py
+
+The corpus records a hash of the text files it was built from; if they have
+changed since, the bot compiles the corpus from them at startup instead.
+
+Besides the Hindi/Telugu/English stores the bot always shows, the corpus
+holds every script in SGS and Sringeri style (``SCRIPT_SOURCES``). Those are
+only decoded when a user first asks for them (see ``TextStores``).
+"""
+import hashlib
+import logging
+import mmap
+import re
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+CORPUS_PATH = BASE_DIR / "gita_corpus.bin"
+
+# Text stores compiled into the corpus, keyed by the name the bot uses for them
+CORPUS_SOURCES = {
+    "hindi": "BG Hindi without Uvacha.txt",
+    "telugu": "BG Telugu Without Uvacha.txt",
+    "english": "BG English without Uvacha.txt",
+    "hindi_full": "BG Hindi with Uvacha.txt",
+    "telugu_full": "BG Telugu with Uvacha.txt",
+    "english_full": "BG English with Uvacha.txt",
+}
+
+# Scripts and recitation styles available per session, stored as "<script>_<style>_full"
+SCRIPTS = ("telugu", "devanagari", "tamil", "kannada", "english")
+STYLES = ("sgs", "sringeri")
+SCRIPT_SOURCES = {
+    "telugu_sgs_full": "BG_Telugu_SGS.txt",
+    "telugu_sringeri_full": "BG_Telugu_Sringeri.txt",
+    "devanagari_sgs_full": "BG_Devanagari_SGS.txt",
+    "devanagari_sringeri_full": "BG_Devanagari_Sringeri.txt",
+    "tamil_sgs_full": "BG_Tamil_SGS.txt",
+    "tamil_sringeri_full": "BG_Tamil_Sringeri.txt",
+    "kannada_sgs_full": "BG_Kannada_SGS.txt",
+    "kannada_sringeri_full": "BG_Kannada_Sringeri.txt",
+    "english_sgs_full": "BG_English_SGS.txt",
+    "english_sringeri_full": "BG_English_Sringeri.txt",
+}
+# Files in the "1.1 uvacha — text" format; every other file is tab separated
+DASH_FORMAT_FILES = {
+    "BG_Telugu_Sringeri.txt", "BG_Devanagari_Sringeri.txt",
+    "BG_Tamil_SGS.txt", "BG_Tamil_Sringeri.txt", "BG_Kannada_SGS.txt", "BG_Kannada_Sringeri.txt",
+}
+# Store whose first quarter sets how many words of a script's first line make its first quarter
+QUARTER_REFERENCE = {"telugu": "telugu", "devanagari": "hindi", "tamil": "telugu", "kannada": "telugu", "english": "english"}
+UVACHA_WORDS = ("उवाच", "ఉవాచ", "உவாச", "ಉವಾಚ", "uvāca", "uvaca")
+UVACHA_STEMS = ("वाच", "వాచ", "வாச", "ವಾಚ", "vāca", "vaca")
+
+# Binary layout (little endian):
+#   header     magic, version, verse count, store count, blob offset, SHA-256 of the text files
+#   verses     (chapter, verse) per ordinal
+#   stores     store name and the offset of its span table
+#   spans      (offset, length) into the blob per ordinal, one table per store
+#   blob       UTF-8 text of every verse
+CORPUS_MAGIC = b"BGSC"
+CORPUS_VERSION = 3
+_HEADER = struct.Struct("<4sHHHxxI32s")
+_VERSE = struct.Struct("<HH")
+_STORE = struct.Struct("<32sI")
+_SPAN = struct.Struct("<II")
+
+
+class CorpusError(Exception):
+    pass
+
+
+# Parse the tab separated "chapter.verse<TAB>text" format into {chapter: [(verse, text)]}
+def parse_shlokas(content):
+    shlokas = {}
+    current_number = None
+    current_text = []
+    for line in content.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        parts = line.split("\t", 1)
+        if len(parts) == 2:
+            if current_number:
+                chapter, verse = current_number.split(".")[:2]
+                shlokas.setdefault(chapter, []).append((verse, "\n".join(current_text)))
+            current_number = parts[0]
+            current_text = [parts[1]]
+        else:
+            current_text.append(line)
+    if current_number:
+        chapter, verse = current_number.split(".")[:2]
+        shlokas.setdefault(chapter, []).append((verse, "\n".join(current_text)))
+    return shlokas
+
+
+# Parse the blank-line separated "chapter.verse [uvacha — ]text" format (Tamil, Kannada, Sringeri files).
+# The uvacha is moved to a line of its own, as in the tab separated files.
+def parse_dash_shlokas(content):
+    shlokas = {}
+    for block in re.split(r"\n\s*\n", content.strip()):
+        lines = [line.strip() for line in block.strip().split("\n") if line.strip()]
+        if not lines:
+            continue
+        number, _, first_line = lines[0].partition(" ")
+        uvacha, dash, text = first_line.partition(" — ")
+        lines[0:1] = [uvacha.strip(), text.strip()] if dash else [first_line.strip()]
+        chapter, verse = number.split(".")[:2]
+        shlokas.setdefault(chapter, []).append((verse, "\n".join(lines)))
+    return shlokas
+
+
+def parse_source(file_name, content):
+    return parse_dash_shlokas(content) if file_name in DASH_FORMAT_FILES else parse_shlokas(content)
+
+
+def _flatten(shlokas):
+    return [((chapter, verse), text) for chapter, entries in shlokas.items() for verse, text in entries]
+
+
+# Split parsed stores into a shared VerseTable and per-store text lists indexed by ordinal
+def align_stores(stores):
+    names = list(stores)
+    flat = {name: _flatten(stores[name]) for name in names}
+    verses = [key for key, _ in flat[names[0]]]
+    for name in names:
+        if [key for key, _ in flat[name]] != verses:
+            raise CorpusError(f"Store '{name}' does not have the same verses as '{names[0]}'")
+    return VerseTable(verses), {name: [text for _, text in flat[name]] for name in names}
+
+
+# Compile the given stores ({name: {chapter: [(verse, text)]}}) into corpus bytes.
+# sources_digest is the sources_hash of the text files they were parsed from.
+def compile_corpus(stores, sources_digest=bytes(32)):
+    verse_table, texts = align_stores(stores)
+    names = list(texts)
+    verses = verse_table.verses
+
+    blob = bytearray()
+    spans = []
+    for name in names:
+        table = []
+        for text in texts[name]:
+            data = text.encode("utf-8")
+            table.append((len(blob), len(data)))
+            blob += data
+        spans.append(table)
+
+    verse_table_offset = _HEADER.size
+    store_table_offset = verse_table_offset + _VERSE.size * len(verses)
+    span_offset = store_table_offset + _STORE.size * len(names)
+    blob_offset = span_offset + _SPAN.size * len(verses) * len(names)
+
+    out = bytearray(_HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, len(verses), len(names), blob_offset, sources_digest))
+    for chapter, verse in verses:
+        out += _VERSE.pack(int(chapter), int(verse))
+    for i, name in enumerate(names):
+        out += _STORE.pack(name.encode("ascii"), span_offset + i * _SPAN.size * len(verses))
+    for table in spans:
+        for offset, length in table:
+            out += _SPAN.pack(offset, length)
+    out += blob
+    return bytes(out)
+
+
+# SHA-256 over the names and contents of the text files the corpus is compiled from
+def sources_hash(base_dir=BASE_DIR, sources=None):
+    if sources is None:
+        sources = {**CORPUS_SOURCES, **SCRIPT_SOURCES}
+    digest = hashlib.sha256()
+    for name, file_name in sources.items():
+        data = (Path(base_dir) / file_name).read_bytes()
+        digest.update(struct.pack("<32sQ", name.encode("ascii"), len(data)))
+        digest.update(data)
+    return digest.digest()
+
+
+# Parse the shipped text files into stores
+def read_text_sources(base_dir=BASE_DIR, sources=None):
+    if sources is None:
+        sources = {**CORPUS_SOURCES, **SCRIPT_SOURCES}
+    return {name: parse_source(file_name, (Path(base_dir) / file_name).read_text(encoding="utf-8-sig"))
+            for name, file_name in sources.items()}
+
+
+def _is_uvacha(line):
+    return any(word in line for word in UVACHA_WORDS)
+
+
+# Lines of a full verse text without its uvacha lines. Those are short ("శ్రీ భగవానువాచ", "అర్జున ఉవాచ"),
+# which keeps verse lines that merely contain the word, such as 1.25 "ఉవాచ పార్థ! పశ్యైతాన్ ...".
+def verse_lines(text):
+    return [line for line in text.split("\n")
+            if line.strip() and not (len(line.split()) <= 3 and any(stem in line for stem in UVACHA_STEMS))]
+
+
+# First quarter of a full verse text: the first word_count words of its first line after the uvacha
+def first_quarter_of(text, word_count):
+    lines = text.split("\n")
+    while len(lines) > 1 and _is_uvacha(lines[0]):
+        lines.pop(0)
+    words = lines[0].split()
+    return " ".join(words[:max(1, word_count)]).rstrip(" ।|")
+
+
+class VerseTable:
+    """Canonical ordering of all verses shared by every text and audio store.
+
+    Verses are addressed by a global ordinal (0 for 1.1, 699 for 18.78).
+    Chapter c spans ordinals ``chapter_starts[c - 1]`` to ``chapter_starts[c]``.
+    """
+
+    def __init__(self, verses):
+        self.verses = [(str(chapter), str(verse)) for chapter, verse in verses]
+        self.ordinals = {key: ordinal for ordinal, key in enumerate(self.verses)}
+        self.chapters = list(dict.fromkeys(chapter for chapter, _ in self.verses))
+        if self.chapters != [str(c) for c in range(1, len(self.chapters) + 1)]:
+            raise CorpusError("Chapters must be numbered 1..N and stored in order")
+        self.chapter_starts = [0] * (len(self.chapters) + 1)
+        for chapter, _ in self.verses:
+            self.chapter_starts[int(chapter)] += 1
+        for c in range(1, len(self.chapter_starts)):
+            self.chapter_starts[c] += self.chapter_starts[c - 1]
+
+    def __len__(self):
+        return len(self.verses)
+
+    def chapter_range(self, chapter):
+        c = int(chapter)
+        return range(self.chapter_starts[c - 1], self.chapter_starts[c])
+
+    # Ordinal of chapter.verse, or None if there is no such verse
+    def ordinal(self, chapter, verse):
+        return self.ordinals.get((str(chapter), str(verse)))
+
+    # Ordinal n verses away, wrapping around from 18.78 to 1.1 and back
+    def offset(self, ordinal, n):
+        return (ordinal + n) % len(self.verses)
+
+    def verse_id(self, ordinal):
+        chapter, verse = self.verses[ordinal]
+        return f"{chapter}.{verse}"
+
+
+class Corpus:
+    """Read-only view over compiled corpus bytes (usually a memory map)."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        magic, version, verse_count, store_count, blob_offset, self.sources_digest = _HEADER.unpack_from(buffer, 0)
+        if magic != CORPUS_MAGIC:
+            raise CorpusError("Not a shloka corpus file")
+        if version != CORPUS_VERSION:
+            raise CorpusError(f"Unsupported corpus version {version} (expected {CORPUS_VERSION})")
+        self.verse_table = VerseTable(
+            _VERSE.unpack_from(buffer, _HEADER.size + i * _VERSE.size) for i in range(verse_count)
+        )
+        self.verses = self.verse_table.verses
+        store_table = _HEADER.size + verse_count * _VERSE.size
+        self._span_tables = {}
+        for i in range(store_count):
+            raw_name, span_table = _STORE.unpack_from(buffer, store_table + i * _STORE.size)
+            self._span_tables[raw_name.rstrip(b"\0").decode("ascii")] = span_table
+        self._blob_offset = blob_offset
+
+    @property
+    def store_names(self):
+        return list(self._span_tables)
+
+    def text(self, store, ordinal):
+        offset, length = _SPAN.unpack_from(self._buffer, self._span_tables[store] + ordinal * _SPAN.size)
+        start = self._blob_offset + offset
+        return bytes(self._buffer[start:start + length]).decode("utf-8")
+
+    # All texts of a store as a list indexed by verse ordinal
+    def texts(self, name):
+        if name not in self._span_tables:
+            raise CorpusError(f"Unknown corpus store '{name}'")
+        return [self.text(name, ordinal) for ordinal in range(len(self.verses))]
+
+
+class TextStores(Mapping):
+    """Text stores by name, decoded from the corpus on first access and kept from then on.
+
+    ``preloaded`` stores (e.g. downloaded from GitHub) take precedence over the
+    corpus. For each script store "<script>_<style>_full" there is also a
+    "<script>_<style>" store with the first quarter of every verse, derived
+    the first time it is used.
+    """
+
+    def __init__(self, corpus, preloaded=None):
+        self.corpus = corpus
+        self._stores = dict(preloaded or {})
+        names = list(self._stores) + [name for name in corpus.store_names if name not in self._stores]
+        names += [name[:-len("_full")] for name in corpus.store_names if name in SCRIPT_SOURCES]
+        self._names = list(dict.fromkeys(names))
+
+    def __getitem__(self, name):
+        texts = self._stores.get(name)
+        if texts is None:
+            if name not in self._names:
+                raise KeyError(name)
+            texts = self._stores[name] = self._load(name)
+            logger.info(f"Loaded text store '{name}'")
+        return texts
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    @property
+    def loaded(self):
+        return list(self._stores)
+
+    def _load(self, name):
+        if name in self.corpus.store_names:
+            return self.corpus.texts(name)
+        full = self[f"{name}_full"]
+        reference = self[QUARTER_REFERENCE[name.split("_")[0]]]
+        return [first_quarter_of(text, len(quarter.split())) for text, quarter in zip(full, reference)]
+
+
+# Load the compiled corpus, falling back to parsing the text files if it is missing or was
+# built from other versions of them. Without the text files the compiled corpus is used as is.
+def load_corpus(path=CORPUS_PATH):
+    try:
+        digest = sources_hash()
+    except OSError:
+        digest = None
+    try:
+        with open(path, "rb") as f:
+            corpus = Corpus(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if digest is not None and corpus.sources_digest != digest:
+            raise CorpusError("the text files changed since it was built; run gita_corpus.py")
+        return corpus
+    except (OSError, ValueError, struct.error, CorpusError) as e:
+        logger.warning(f"⚠️ Could not load {path} ({e}); compiling corpus from text files")
+        return Corpus(compile_corpus(read_text_sources(), digest))
+
+
+def main():
+    data = compile_corpus(read_text_sources(), sources_hash())
+    CORPUS_PATH.write_bytes(data)
+    corpus = Corpus(data)
+    print(f"✅ Saved {CORPUS_PATH.name} with {len(corpus.verses)} verses x {len(corpus.store_names)} stores ({len(data)} bytes).")
+
+
+if __name__ == "__main__":
+    main()
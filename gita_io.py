@@ -0,0 +1,85 @@
+"""Shared I/O helpers for code running on the bot's event loop.
+
+``AsyncHTTPClient`` is the one HTTP client the bot uses for outbound calls:
+pooled keep-alive connections, timeouts, a cap on concurrent requests and
+retries with exponential backoff. ``run_blocking`` moves unavoidable
+synchronous work (SQLite, large JSON parsing) onto a bounded thread pool so
+no handler can stall the loop.
+"""
+import asyncio
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from gita_metrics import HTTP_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_executor = None
+
+
+def configure_blocking_pool(max_workers):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args):
+    if _executor is None:
+        configure_blocking_pool(4)
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+class AsyncHTTPClient:
+    def __init__(self, max_connections=20, max_concurrency=10, timeout=10.0, retries=3, backoff=0.5, headers=None):
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers=headers,
+            follow_redirects=True,
+        )
+
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt * (0.5 + random.random() / 2)
+
+    # Send a request, retrying transport errors and retryable statuses with backoff.
+    # The last response is returned even if its status is an error; raise_for_status() is up to the caller.
+    async def request(self, method, url, **kwargs):
+        host = httpx.URL(url).host
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await self._client.request(method, url, **kwargs)
+                HTTP_REQUESTS.inc(host, str(response.status_code))
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+            except httpx.TransportError as e:
+                HTTP_REQUESTS.inc(host, "error")
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"⚠️ {method} {url} failed ({e}), retrying")
+            await asyncio.sleep(self._delay(attempt, response))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
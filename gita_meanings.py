@@ -0,0 +1,118 @@
+"""In-process store for shloka meanings.
+
+Meanings are loaded once from the local ``meanings.txt`` and kept as
+pre-formatted replies keyed by shloka id. The store refreshes itself from
+GitHub in the background with conditional (ETag) requests once its TTL has
+expired, so lookups never wait on the network.
+"""
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+
+import httpx
+
+from gita_io import run_blocking
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+MEANINGS_PATHS = (BASE_DIR / "meanings.txt", BASE_DIR / "meanings_extended.json")
+WORD_MEANINGS_KEY = "ప్రతిపదార్థం"
+TRANSLATION_KEY = "అర్థము"
+
+
+# Render one verse entry of meanings.txt as the bot reply
+def format_meaning(data):
+    word_meanings = "\n".join([f"{word}: {meaning}" for word, meaning in data[WORD_MEANINGS_KEY].items()]) if data[WORD_MEANINGS_KEY] else "No word meanings available."
+    translation = data[TRANSLATION_KEY]
+    return f"Word Meanings:\n{word_meanings}\n\nTranslation:\n{translation}"
+
+
+class MeaningsStore:
+    def __init__(self, remote_url=None, token=None, ttl=3600, paths=MEANINGS_PATHS, http=None):
+        # http: shared gita_io.AsyncHTTPClient used for refreshes
+        self.http = http
+        self.remote_url = remote_url
+        self.token = token
+        self.ttl = ttl
+        self.etag = None
+        self.loaded_at = 0.0
+        self._meanings = {}
+        self._replies = {}
+        self._refresh_task = None
+        for path in paths:
+            try:
+                self._install(json.loads(Path(path).read_text(encoding="utf-8")))
+                logger.info(f"Loaded {len(self._replies)} meanings from {Path(path).name}")
+                break
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Could not load meanings from {path}: {e}")
+
+    def __len__(self):
+        return len(self._replies)
+
+    def __contains__(self, shloka_id):
+        return shloka_id in self._replies
+
+    @staticmethod
+    def _format_all(meanings):
+        replies = {}
+        for shloka_id, data in meanings.items():
+            try:
+                replies[shloka_id] = format_meaning(data)
+            except (KeyError, AttributeError, TypeError):
+                logger.warning(f"⚠️ Skipping malformed meaning entry {shloka_id}")
+        return replies
+
+    def _install(self, meanings, replies=None):
+        if replies is None:
+            replies = self._format_all(meanings)
+        # Swap both dicts in one go so readers never see a half-built store
+        self._meanings, self._replies = meanings, replies
+        self.loaded_at = time.monotonic()
+
+    def raw(self, shloka_id):
+        return self._meanings.get(shloka_id)
+
+    # Pre-formatted reply for a shloka, or None if it is unknown
+    def get(self, shloka_id):
+        if self.remote_url and self.http and time.monotonic() - self.loaded_at > self.ttl:
+            self.refresh_in_background()
+        return self._replies.get(shloka_id)
+
+    # Start a refresh on the running event loop unless one is already in flight
+    def refresh_in_background(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            pass
+
+    # Conditionally re-download the meanings file; a 304 only renews the TTL
+    async def refresh(self):
+        headers = {"Accept": "application/vnd.github.raw"}
+        if self.token:
+            headers["Authorization"] = f"token {self.token}"
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        try:
+            response = await self.http.get(self.remote_url, headers=headers)
+            if response.status_code == 304:
+                self.loaded_at = time.monotonic()
+                return False
+            response.raise_for_status()
+            # Parsing and formatting ~1 MB of JSON would stall the event loop
+            meanings = await run_blocking(json.loads, response.content)
+            replies = await run_blocking(self._format_all, meanings)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Failed to refresh meanings from {self.remote_url}: {e}")
+            # Back off for a full TTL instead of retrying on every lookup
+            self.loaded_at = time.monotonic()
+            return False
+        self._install(meanings, replies)
+        self.etag = response.headers.get("ETag")
+        logger.info(f"Refreshed {len(self._replies)} meanings from GitHub")
+        return True
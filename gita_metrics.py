@@ -0,0 +1,134 @@
+"""Process metrics in the Prometheus text format.
+
+A small registry of counters, gauges and histograms served on ``/metrics``.
+Updating a metric on the message path is a dict lookup and an addition.
+Values the bot already tracks (cache hit counts, session store size) are
+registered as callbacks and only read when the endpoint is scraped.
+"""
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        # callback: returns the current value, or {label values tuple: value}, read at scrape time
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+
+    def _current(self):
+        if self.callback is None:
+            return self._values
+        value = self.callback()
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self._current().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+# Gauges are read from their callback at scrape time
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), sum, count
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=(), callback=None):
+    return REGISTRY.register(Counter(name, documentation, labelnames, callback))
+
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Metrics shared by several modules
+COMMAND_SECONDS = histogram("gita_command_seconds", "Time spent handling one message, by command", ("command",))
+TELEGRAM_REQUESTS = counter("gita_telegram_requests_total", "Bot API requests sent, by method and HTTP status", ("method", "status"))
+HTTP_REQUESTS = counter("gita_http_requests_total", "Outbound HTTP requests (GitHub), by host and HTTP status", ("host", "status"))
+
+
+def render():
+    return REGISTRY.render()
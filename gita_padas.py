@@ -0,0 +1,102 @@
+"""Pada-level index of the corpus for practice by quarter verse.
+
+Every verse has four padas. ``PadaTable`` splits their Telugu text out of the
+corpus once at startup, notes which padas have a recording in each
+``AQ4Paadas*`` audio set (from the audio catalog, see ``gita_audio_catalog``) and precomputes the practice pools (all first padas,
+all third padas, all padas; for the whole Gita and for each chapter) that
+random practice draws from. A pada is addressed by its pada id,
+``ordinal * 4 + pada - 1``.
+"""
+import logging
+import os
+import re
+from array import array
+from pathlib import Path
+
+from gita_audio_cache import audio_key, audio_path
+from gita_corpus import verse_lines
+from gita_search import split_padas
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+PADAS_PER_VERSE = 4
+# Pada audio set per recitation style
+PADA_AUDIO_SETS = {"sgs": "AQ4PaadasSGS", "sringeri": "AQ4PaadasSringeri"}
+# Practice commands and the padas they draw from
+PRACTICE_PADAS = {"q": (1, 2, 3, 4), "q1": (1,), "q3": (3,)}
+_PADA_FILE = re.compile(r"(\d+)\.([1-4])\.mp3")
+
+
+class PadaTable:
+    def __init__(self, verse_table, full_texts, base_dir=BASE_DIR, catalog=None):
+        # full_texts: full Telugu verse text per ordinal of verse_table; catalog: the loaded audio catalog
+        self.verse_table = verse_table
+        self.texts = []
+        for text in full_texts:
+            padas = split_padas(verse_lines(text))[:PADAS_PER_VERSE]
+            self.texts.extend(padas + [""] * (PADAS_PER_VERSE - len(padas)))
+        files = (catalog or {}).get("files")
+        self._audio = {
+            style: self._catalogued(audio_set, files) if files else self._scan(Path(base_dir) / audio_set)
+            for style, audio_set in PADA_AUDIO_SETS.items()
+        }
+        self._pools = {}
+        for command, padas in PRACTICE_PADAS.items():
+            for chapter in (None, *verse_table.chapters):
+                ordinals = range(len(verse_table)) if chapter is None else verse_table.chapter_range(chapter)
+                self._pools[command, chapter] = array("H", (
+                    pada_id for pada_id in (ordinal * PADAS_PER_VERSE + pada - 1 for ordinal in ordinals for pada in padas)
+                    if self.texts[pada_id]
+                ))
+        logger.info(f"Indexed {len(self.texts)} padas, {', '.join(f'{sum(found)} {style} recordings' for style, found in self._audio.items())}")
+
+    def __len__(self):
+        return len(self.texts)
+
+    # One flag per pada id: whether the catalog lists its recording in audio_set
+    def _catalogued(self, audio_set, files):
+        found = bytearray(len(self.texts))
+        for pada_id in range(len(self.texts)):
+            ordinal, pada = self.locate(pada_id)
+            found[pada_id] = audio_path(audio_key(audio_set, *self.verse_table.verses[ordinal], pada)) in files
+        return found
+
+    # One flag per pada id: whether folder holds its recording. Without a local copy of the
+    # folder (audio served from GitHub only) every pada is assumed to be recorded.
+    def _scan(self, folder):
+        found = bytearray(len(self.texts))
+        if not folder.is_dir():
+            return bytearray(b"\x01" * len(self.texts))
+        for chapter_dir in os.scandir(folder):
+            chapter = chapter_dir.name.rpartition(" ")[2]
+            if not chapter_dir.is_dir() or not chapter.isdigit():
+                continue
+            for entry in os.scandir(chapter_dir.path):
+                match = _PADA_FILE.fullmatch(entry.name)
+                if match is None:
+                    continue
+                ordinal = self.verse_table.ordinal(chapter, int(match.group(1)))
+                if ordinal is not None:
+                    found[ordinal * PADAS_PER_VERSE + int(match.group(2)) - 1] = 1
+        return found
+
+    # (ordinal, pada number) of a pada id
+    def locate(self, pada_id):
+        ordinal, index = divmod(pada_id, PADAS_PER_VERSE)
+        return ordinal, index + 1
+
+    def text(self, pada_id):
+        return self.texts[pada_id]
+
+    # Audio key of the pada's recording in style, or None if it has none
+    def audio(self, pada_id, style):
+        if not self._audio[style][pada_id]:
+            return None
+        ordinal, pada = self.locate(pada_id)
+        chapter, verse = self.verse_table.verses[ordinal]
+        return audio_key(PADA_AUDIO_SETS[style], chapter, verse, pada)
+
+    # Pada ids a practice command draws from, for one chapter or (chapter None) the whole Gita
+    def pool(self, command, chapter=None):
+        return self._pools[command, None if chapter is None else str(int(chapter))]
@@ -0,0 +1,447 @@
+"""Continuous chapter playback ("parayana") from the whole-chapter recordings.
+
+``SGSParayana/`` and ``SringeriParayana/`` hold one MP3 per chapter and
+``shloka_timings_*.json`` the start time of every verse in it. A verse range
+is served as a byte span of the chapter file: the start and end times are
+mapped to byte offsets (linearly for CBR files, through the Xing table of
+contents for VBR files) and snapped to the next MP3 frame header, so the
+span plays without re-encoding. ``parse_range`` applies an HTTP Range
+header to such a span.
+
+Running this module walks the frame headers of every recording once and
+writes a ``.idx`` sidecar next to it (see ``FrameIndex``). With a sidecar,
+verse spans are exact frame boundaries looked up in O(1), and they are
+read straight out of a shared memory map.
+"""
+import json
+import logging
+import mmap
+import struct
+import zlib
+from array import array
+from itertools import accumulate
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# style -> (directory with <chapter:02d>.mp3 files, verse timings file)
+PARAYANA_STYLES = {
+    "sgs": ("SGSParayana", "shloka_timings_sgs.json"),
+    "sringeri": ("SringeriParayana", "shloka_timings_sringeri.json"),
+}
+
+# Bitrates in kbps by [MPEG-1][bitrate index] for layer III
+_BITRATES = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class FrameHeader:
+    __slots__ = ("version", "mpeg1", "bitrate", "sample_rate", "padding", "mono", "length", "samples")
+
+    def __init__(self, version, bitrate, sample_rate, padding, mono):
+        self.version = version
+        self.mpeg1 = version == 3
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.padding = padding
+        self.mono = mono
+        self.samples = 1152 if self.mpeg1 else 576
+        self.length = (144 if self.mpeg1 else 72) * bitrate * 1000 // sample_rate + padding
+
+    def same_stream(self, other):
+        return self.version == other.version and self.sample_rate == other.sample_rate
+
+
+# Decode a 4-byte MPEG audio layer III frame header, or None if data does not start with one
+def parse_frame_header(data):
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return None
+    version = data[1] >> 3 & 3
+    layer = data[1] >> 1 & 3
+    bitrate_index = data[2] >> 4
+    rate_index = data[2] >> 2 & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    return FrameHeader(
+        version,
+        _BITRATES[version == 3][bitrate_index],
+        _SAMPLE_RATES[version][rate_index],
+        data[2] >> 1 & 1,
+        data[3] >> 6 == 3,
+    )
+
+
+class Mp3Layout:
+    """Where the audio frames of an MP3 file are and how playback time maps to byte offsets."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.size = self.path.stat().st_size
+        with self.path.open("rb") as f:
+            head = f.read(10)
+            self.audio_start = 0
+            if head[:3] == b"ID3":
+                self.audio_start = 10 + (head[6] << 21 | head[7] << 14 | head[8] << 7 | head[9])
+                if head[5] & 0x10:  # footer present
+                    self.audio_start += 10
+            f.seek(self.audio_start)
+            first = f.read(512)
+            f.seek(max(0, self.size - 128))
+            self.audio_end = self.size - 128 if f.read(3) == b"TAG" else self.size
+        self.first_frame = parse_frame_header(first)
+        if self.first_frame is None:
+            raise ValueError(f"{self.path} does not start with an MPEG layer III frame")
+        self.toc = None
+        self.frames = None
+        self._read_xing(first)
+        if self.frames:
+            self.duration = self.frames * self.first_frame.samples / self.first_frame.sample_rate
+        else:
+            self.duration = (self.audio_end - self.audio_start) * 8 / (self.first_frame.bitrate * 1000)
+
+    def _read_xing(self, first):
+        frame = self.first_frame
+        side_info = (17 if frame.mono else 32) if frame.mpeg1 else (9 if frame.mono else 17)
+        position = 4 + side_info
+        tag = first[position:position + 4]
+        if tag not in (b"Xing", b"Info"):
+            return
+        flags = struct.unpack(">I", first[position + 4:position + 8])[0]
+        position += 8
+        if flags & 1:
+            self.frames = struct.unpack(">I", first[position:position + 4])[0]
+            position += 4
+        if flags & 2:
+            position += 4
+        # A table of contents is only needed (and only trusted) for VBR "Xing" files
+        if flags & 4 and tag == b"Xing":
+            self.toc = first[position:position + 100]
+
+    # Estimated byte offset of playback time seconds, before frame alignment
+    def estimate(self, seconds):
+        if seconds <= 0:
+            return self.audio_start
+        if seconds >= self.duration:
+            return self.audio_end
+        length = self.audio_end - self.audio_start
+        if self.toc is None:
+            return self.audio_start + int(seconds / self.duration * length)
+        percent = seconds / self.duration * 100
+        index = min(int(percent), 99)
+        lower = self.toc[index]
+        upper = self.toc[index + 1] if index < 99 else 256
+        fraction = lower + (upper - lower) * (percent - index)
+        return self.audio_start + int(fraction / 256 * length)
+
+    # First frame header at or after offset that is followed by another frame of the same stream
+    def align(self, f, offset, window=8192):
+        if offset <= self.audio_start:
+            return self.audio_start
+        if offset >= self.audio_end:
+            return self.audio_end
+        f.seek(offset)
+        data = f.read(window)
+        for i in range(len(data) - 3):
+            header = parse_frame_header(data[i:i + 4])
+            if header is None or not header.same_stream(self.first_frame):
+                continue
+            following = parse_frame_header(data[i + header.length:i + header.length + 4])
+            if following is not None and following.same_stream(self.first_frame):
+                return offset + i
+        return offset
+
+    # Byte offset of the frame that plays at time seconds
+    def offset(self, f, seconds):
+        return self.align(f, self.estimate(seconds))
+
+
+# Sidecar layout (little-endian): header, verse offsets uint32[verses + 1] (the last one is the end
+# of the audio), frame lengths uint16[frames]. Frame n starts at audio_start + sum(lengths[:n]) and
+# plays at n * samples_per_frame / sample_rate seconds; every layer III frame has the same sample count.
+INDEX_MAGIC = b"GPFI"
+INDEX_VERSION = 1
+_INDEX_HEADER = struct.Struct("<4sHHIIIIIII")
+INDEX_SUFFIX = ".idx"
+
+
+# CRC of the first 64 KiB, stored with the file size so a sidecar is only used for the file it describes
+def _fingerprint(data):
+    return zlib.crc32(data[:65536])
+
+
+class FrameIndex:
+    """Byte offset of every audio frame of an MP3 file, joined with the start of every verse."""
+
+    def __init__(self, size, fingerprint, audio_start, samples_per_frame, sample_rate, frame_lengths, verse_offsets):
+        self.size = size
+        self.fingerprint = fingerprint
+        self.audio_start = audio_start
+        self.samples_per_frame = samples_per_frame
+        self.sample_rate = sample_rate
+        self.frame_lengths = frame_lengths
+        # offsets[n] is the start of frame n, offsets[-1] the end of the last frame
+        self.offsets = array("I", accumulate(frame_lengths, initial=audio_start))
+        self.verse_offsets = verse_offsets
+
+    @property
+    def frame_duration(self):
+        return self.samples_per_frame / self.sample_rate
+
+    @property
+    def duration(self):
+        return len(self.frame_lengths) * self.frame_duration
+
+    def timestamp(self, frame):
+        return frame * self.frame_duration
+
+    # Offset of the first frame that starts at or after seconds
+    def offset(self, seconds):
+        frame = min(len(self.frame_lengths), max(0, -int(-seconds // self.frame_duration)))
+        return self.offsets[frame]
+
+    def verse_span(self, first, last):
+        return self.verse_offsets[first - 1], self.verse_offsets[last]
+
+    @classmethod
+    def build(cls, data, starts):
+        """Walk the frame headers of MP3 data and join them with verse start times."""
+        layout_start = 0
+        if data[:3] == b"ID3":
+            layout_start = 10 + (data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9])
+            if data[5] & 0x10:
+                layout_start += 10
+        audio_end = len(data) - 128 if data[-128:-125] == b"TAG" else len(data)
+        first = parse_frame_header(data[layout_start:layout_start + 4])
+        if first is None:
+            raise ValueError("data does not start with an MPEG layer III frame")
+        audio_start = layout_start
+        # A Xing/Info frame carries no audio, so playback time starts after it
+        side_info = (17 if first.mono else 32) if first.mpeg1 else (9 if first.mono else 17)
+        if data[layout_start + 4 + side_info:layout_start + 8 + side_info] in (b"Xing", b"Info"):
+            audio_start += first.length
+        lengths = array("H")
+        position = audio_start
+        while position + 4 <= audio_end:
+            header = parse_frame_header(data[position:position + 4])
+            if header is None or not header.same_stream(first):
+                # Skip junk between frames by resyncing on the next frame header
+                next_sync = data.find(b"\xff", position + 1, audio_end)
+                if next_sync < 0:
+                    break
+                if lengths:
+                    lengths[-1] += next_sync - position
+                else:
+                    audio_start = next_sync
+                position = next_sync
+                continue
+            length = min(header.length, audio_end - position)
+            lengths.append(length)
+            position += length
+        frame_duration = first.samples / first.sample_rate
+        offsets = list(accumulate(lengths, initial=audio_start))
+        verse_offsets = array("I", (offsets[min(len(lengths), max(0, -int(-start // frame_duration)))] for start in starts))
+        verse_offsets.append(offsets[-1])
+        return cls(len(data), _fingerprint(data), audio_start, first.samples, first.sample_rate, lengths, verse_offsets)
+
+    def to_bytes(self):
+        header = _INDEX_HEADER.pack(
+            INDEX_MAGIC, INDEX_VERSION, self.samples_per_frame, self.sample_rate, self.size, self.fingerprint,
+            self.audio_start, len(self.frame_lengths), len(self.verse_offsets) - 1, 0,
+        )
+        return header + self.verse_offsets.tobytes() + self.frame_lengths.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        (magic, version, samples_per_frame, sample_rate, size, fingerprint,
+         audio_start, frames, verses, _) = _INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("not a parayana frame index")
+        position = _INDEX_HEADER.size
+        verse_offsets = array("I", data[position:position + 4 * (verses + 1)])
+        position += 4 * (verses + 1)
+        frame_lengths = array("H", data[position:position + 2 * frames])
+        if len(frame_lengths) != frames or len(verse_offsets) != verses + 1:
+            raise ValueError("truncated parayana frame index")
+        return cls(size, fingerprint, audio_start, samples_per_frame, sample_rate, frame_lengths, verse_offsets)
+
+
+class ByteSpan:
+    """Read-only view of bytes [start, end) of a memory-mapped file, readable like a file.
+
+    ``fileno()`` is a descriptor positioned at ``start``, so WSGI servers with
+    sendfile support (gunicorn's ``wsgi.file_wrapper``) send the span without
+    copying it through Python at all.
+    """
+
+    def __init__(self, path, data, start, end):
+        self.data = data
+        self.start = start
+        self.end = end
+        self.position = start
+        self._file = None
+        self._path = path
+
+    def __len__(self):
+        return self.end - self.start
+
+    # Bytes [start, end) of this span, relative to its beginning
+    def slice(self, start, end):
+        return ByteSpan(self._path, self.data, self.start + start, self.start + end)
+
+    def read(self, size=-1):
+        remaining = self.end - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        chunk = self.data[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+    def fileno(self):
+        if self._file is None:
+            self._file = open(self._path, "rb")
+            self._file.seek(self.position)
+        return self._file.fileno()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParayanaLibrary:
+    """Chapter recordings and verse timings for every parayana style."""
+
+    def __init__(self, base_dir=BASE_DIR, styles=PARAYANA_STYLES):
+        self.base_dir = Path(base_dir)
+        self.styles = styles
+        self.timings = {}
+        for style, (_, timings_file) in styles.items():
+            try:
+                timings = json.loads((self.base_dir / timings_file).read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Could not load parayana timings for {style}: {e}")
+                timings = {}
+            # chapter -> verse start times in seconds, in verse order (index 0 is verse 1)
+            self.timings[style] = {
+                int(chapter): [start for _, start in sorted((int(verse), start) for verse, start in verses.items())]
+                for chapter, verses in timings.items()
+            }
+        self._layouts = {}
+        self._indexes = {}
+        self._maps = {}
+
+    def path(self, style, chapter):
+        return self.base_dir / self.styles[style][0] / f"{chapter:02d}.mp3"
+
+    def chapters(self, style):
+        return [chapter for chapter in sorted(self.timings.get(style, ())) if self.path(style, chapter).is_file()]
+
+    def has_chapter(self, style, chapter):
+        return style in self.styles and chapter in self.timings[style] and self.path(style, chapter).is_file()
+
+    def layout(self, style, chapter):
+        key = (style, chapter)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = Mp3Layout(self.path(style, chapter))
+        return layout
+
+    def verse_count(self, style, chapter):
+        return len(self.timings[style].get(chapter, ()))
+
+    def _map(self, path):
+        data = self._maps.get(path)
+        if data is None:
+            with open(path, "rb") as f:
+                data = self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return data
+
+    # The frame index of a chapter recording, or None if its sidecar is missing or stale
+    def index(self, style, chapter):
+        key = (style, chapter)
+        if key not in self._indexes:
+            path = self.path(style, chapter)
+            index = None
+            try:
+                index = FrameIndex.from_bytes(Path(f"{path}{INDEX_SUFFIX}").read_bytes())
+                data = self._map(path)
+                if (index.size != len(data) or index.fingerprint != _fingerprint(data)
+                        or len(index.verse_offsets) != self.verse_count(style, chapter) + 1):
+                    logger.warning(f"⚠️ Frame index of {path} is stale, rebuild it with gita_parayana.py")
+                    index = None
+            except (OSError, ValueError, struct.error):
+                pass
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def build_index(self, style, chapter):
+        path = self.path(style, chapter)
+        index = FrameIndex.build(self._map(path), self.timings[style][chapter])
+        Path(f"{path}{INDEX_SUFFIX}").write_bytes(index.to_bytes())
+        self._indexes[(style, chapter)] = index
+        return index
+
+    # (path, start, end) of the bytes playing verses first..last of a chapter; end is exclusive.
+    # Without a verse range the whole file is served, tags included.
+    def span(self, style, chapter, first=None, last=None):
+        if not self.has_chapter(style, chapter):
+            raise KeyError(f"No {style} parayana recording for chapter {chapter}")
+        path = self.path(style, chapter)
+        if first is None and last is None:
+            return path, 0, path.stat().st_size
+        starts = self.timings[style][chapter]
+        first = first or 1
+        last = last or len(starts)
+        if not 1 <= first <= last <= len(starts):
+            raise ValueError(f"Chapter {chapter} has verses 1-{len(starts)}")
+        index = self.index(style, chapter)
+        if index is not None:
+            return (path, *index.verse_span(first, last))
+        layout = self.layout(style, chapter)
+        with layout.path.open("rb") as f:
+            start = layout.offset(f, starts[first - 1])
+            end = layout.offset(f, starts[last]) if last < len(starts) else layout.audio_end
+        return layout.path, start, end
+
+    # The span of span() as a memory-mapped ByteSpan
+    def open_span(self, style, chapter, first=None, last=None):
+        path, start, end = self.span(style, chapter, first, last)
+        return ByteSpan(path, self._map(path), start, end)
+
+
+# Apply an HTTP Range header to a resource of size bytes.
+# Returns (start, end) with end exclusive, None without a usable Range header, or raises ValueError if unsatisfiable.
+def parse_range(header, size):
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if not first:
+            start, end = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, min(end, size)
+
+
+# Write the frame index sidecar of every parayana recording
+def main():
+    library = ParayanaLibrary()
+    for style in library.styles:
+        for chapter in library.chapters(style):
+            index = library.build_index(style, chapter)
+            print(f"✅ Indexed {library.path(style, chapter).relative_to(library.base_dir)}: "
+                  f"{len(index.frame_lengths)} frames, {len(index.verse_offsets) - 1} verses, {index.duration:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Cache of rendered verse messages.
+
+The corpus never changes while the bot runs, so each verse is formatted at
+most once per display mode and the handlers just look the string up.
+"""
+
+LANGUAGE_LABELS = {"telugu": "Telugu", "hindi": "Hindi", "english": "English"}
+DEFAULT_LANGUAGES = ("telugu", "hindi", "english")
+STYLE_LABELS = {"sgs": "SGS", "sringeri": "Sringeri"}
+
+
+# "tamil_sringeri" -> "Tamil (Sringeri)"
+def store_label(language):
+    if language in LANGUAGE_LABELS:
+        return LANGUAGE_LABELS[language]
+    script, _, style = language.partition("_")
+    if style in STYLE_LABELS:
+        return f"{script.title()} ({STYLE_LABELS[style]})"
+    return language.title()
+
+
+class ResponseCache:
+    def __init__(self, verse_table, texts):
+        # texts: {store name: [text per ordinal]}, usually a lazy gita_corpus.TextStores;
+        # "<language>_full" stores include the uvacha lines
+        self.verse_table = verse_table
+        self.texts = texts
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _store(self, language, uvacha):
+        return self.texts[f"{language}_full" if uvacha else language]
+
+    def _format(self, ordinal, uvacha, languages):
+        sections = "\n\n".join(
+            f"{store_label(language)}:\n{self._store(language, uvacha)[ordinal]}"
+            for language in languages
+        )
+        return f"{self.verse_table.verse_id(ordinal)}\n{sections}"
+
+    # Message text for a verse; uvacha=False gives the first quarter used for practice
+    def render(self, ordinal, uvacha=True, languages=DEFAULT_LANGUAGES):
+        key = (ordinal, uvacha, languages)
+        text = self._cache.get(key)
+        if text is None:
+            self.misses += 1
+            text = self._cache[key] = self._format(ordinal, uvacha, languages)
+        else:
+            self.hits += 1
+        return text
+
+    # Render every verse up front for the given (uvacha, languages) modes
+    def prerender(self, modes=((True, DEFAULT_LANGUAGES), (False, DEFAULT_LANGUAGES))):
+        for uvacha, languages in modes:
+            for ordinal in range(len(self.verse_table)):
+                self._cache.setdefault((ordinal, uvacha, languages), self._format(ordinal, uvacha, languages))
@@ -0,0 +1,94 @@
+"""Spaced-repetition schedule for memorization practice.
+
+``ReviewDeck`` keeps one user's items (whole verses and single padas) on an
+SM-2 schedule: every grade moves the item's next review further out the
+better it was recalled, and resets it after a lapse. Due items sit in a
+min-heap keyed by due time, so the next item to practise is found in
+O(log n) even with all 700 verses and 2800 padas in the deck. Outdated heap
+entries are skipped lazily and compacted away once they dominate.
+"""
+import heapq
+
+# Item ids: a verse is its ordinal, a pada PADA_ITEM_BASE + its pada id (see gita_padas)
+PADA_ITEM_BASE = 1000
+# Grade replies and their SM-2 quality (0-5)
+GRADES = {"again": 1, "hard": 3, "good": 4, "easy": 5}
+DAY = 24 * 3600
+# A lapsed item comes back within the same session
+RELEARN_DELAY = 10 * 60
+MIN_EASE = 1.3
+
+
+def verse_item(ordinal):
+    return ordinal
+
+
+def pada_item(pada_id):
+    return PADA_ITEM_BASE + pada_id
+
+
+# ("verse", ordinal) or ("pada", pada id) of an item id
+def item_kind(item):
+    return ("pada", item - PADA_ITEM_BASE) if item >= PADA_ITEM_BASE else ("verse", item)
+
+
+class ReviewDeck:
+    __slots__ = ("cards", "_heap")
+
+    def __init__(self, cards=None):
+        # item -> [due (epoch seconds), interval (days), ease, successful repetitions in a row]
+        self.cards = cards or {}
+        self._heap = [(card[0], item) for item, card in self.cards.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __contains__(self, item):
+        return item in self.cards
+
+    def _schedule(self, item, due):
+        self.cards[item][0] = due
+        heapq.heappush(self._heap, (due, item))
+        if len(self._heap) > 2 * len(self.cards) + 16:
+            self._heap = [(card[0], item) for item, card in self.cards.items()]
+            heapq.heapify(self._heap)
+
+    # Record a review of item with an SM-2 quality (0-5); new items join the deck. Returns the next due time.
+    def grade(self, item, quality, now):
+        card = self.cards.setdefault(item, [now, 0.0, 2.5, 0])
+        _, interval, ease, repetitions = card
+        if quality < 3:
+            repetitions, interval = 0, 0.0
+            due = now + RELEARN_DELAY
+        else:
+            repetitions += 1
+            interval = 1.0 if repetitions == 1 else 6.0 if repetitions == 2 else interval * ease
+            due = now + int(interval * DAY)
+        ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        # Rounded so a full deck stays small in the stored session
+        card[1:] = [round(interval, 2), round(ease, 2), repetitions]
+        self._schedule(item, due)
+        return due
+
+    def _top(self):
+        heap = self._heap
+        while heap and self.cards.get(heap[0][1], (None,))[0] != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    # (due time, item) of the item due soonest, or None for an empty deck
+    def upcoming(self):
+        return self._top()
+
+    # The item most overdue at time now, or None if nothing is due yet
+    def next_due(self, now):
+        top = self._top()
+        return top[1] if top and top[0] <= now else None
+
+    def to_dict(self):
+        return {str(item): card for item, card in self.cards.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({int(item): list(card) for item, card in (data or {}).items()})
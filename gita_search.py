@@ -0,0 +1,385 @@
+"""Search indexes over the shloka corpus."""
+import bisect
+import heapq
+import re
+import time
+import unicodedata
+from collections import Counter
+
+from gita_translit import is_indic, to_latin, to_telugu_block
+
+
+class PrefixIndex:
+    """Character trie mapping text prefixes to entries, in insertion order.
+
+    Every node keeps the positions of all entries below it, so a lookup costs
+    O(len(prefix)) to walk the trie plus O(k) to slice out a page of k hits.
+    Only the first ``max_depth`` characters are indexed; longer prefixes are
+    answered by filtering the deepest node.
+    """
+
+    def __init__(self, entries, max_depth=32):
+        # entries: iterable of (key, value); results come back in this order
+        self.max_depth = max_depth
+        self._keys = []
+        self._values = []
+        self._root = ({}, [])
+        for key, value in entries:
+            key = unicodedata.normalize("NFC", key.strip())
+            position = len(self._keys)
+            self._keys.append(key)
+            self._values.append(value)
+            node = self._root
+            node[1].append(position)
+            for ch in key[:max_depth]:
+                node = node[0].setdefault(ch, ({}, []))
+                node[1].append(position)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _positions(self, prefix):
+        node = self._root
+        for ch in prefix[:self.max_depth]:
+            node = node[0].get(ch)
+            if node is None:
+                return []
+        if len(prefix) <= self.max_depth:
+            return node[1]
+        return [p for p in node[1] if self._keys[p].startswith(prefix)]
+
+    def count(self, prefix):
+        return len(self._positions(unicodedata.normalize("NFC", prefix)))
+
+    # Return (page of values, total matches); limit=-1 returns everything from offset on
+    def search(self, prefix, offset=0, limit=10):
+        positions = self._positions(unicodedata.normalize("NFC", prefix))
+        end = len(positions) if limit == -1 else offset + limit
+        return [self._values[p] for p in positions[offset:end]], len(positions)
+
+
+# ITRANS spellings (as in gita_word_index.txt) rewritten before the common Latin normalization
+_ITRANS_MARKS = (("R^i", "ri"), ("R^I", "ri"), (".n", "m"), (".h", ""), ("GY", "jn"), ("JN", "n"),
+                 ("N^", "n"), ("~N", "n"), ("~n", "n"))
+# IAST letters whose ASCII base letter alone would lose too much
+_IAST_LETTERS = {"ṛ": "ri", "ṝ": "ri", "ḷ": "li"}
+# Applied in order to lowercase ASCII: aspirated/palatal spellings and long vowels collapse
+_LATIN_FOLDS = (("shh", "s"), ("sh", "s"), ("chh", "c"), ("ch", "c"), ("x", "ks"), ("w", "v"),
+                ("aa", "a"), ("ii", "i"), ("uu", "u"), ("ee", "e"), ("oo", "o"))
+_TOKEN = re.compile(r"[^\s\-—–।॥|.,;:!?'\"()\[\]{}0-9%]+")
+_INDIC_MARKS = dict.fromkeys(map(ord, "\u200c\u200d²³⁴"), None)
+STOPWORDS = frozenset("a an and are as at be by for from he his i in is it me my of on or so that the this to was who with you your".split())
+
+
+# Script-independent search key for a Latin (ITRANS, IAST or plain) word
+def latin_key(word):
+    for mark, replacement in _ITRANS_MARKS:
+        word = word.replace(mark, replacement)
+    word = "".join(_IAST_LETTERS.get(ch, ch) for ch in word.lower())
+    word = "".join(ch for ch in unicodedata.normalize("NFKD", word) if ch.isascii() and ch.isalpha())
+    for spelling, replacement in _LATIN_FOLDS:
+        word = word.replace(spelling, replacement)
+    return word
+
+
+# Search key for an Indic word: Devanagari and Kannada are mapped onto the parallel Telugu code points
+def indic_key(word):
+    return to_telugu_block(word).translate(_INDIC_MARKS)
+
+
+def word_key(word):
+    if any(ch.isascii() and ch.isalpha() for ch in word):
+        return latin_key(word)
+    return indic_key(word)
+
+
+def tokenize(text):
+    return _TOKEN.findall(text)
+
+
+# Parse gita_word_index.txt ("word = meaning" lines, each verse closed by "(1.01)||") into
+# [((chapter, verse), [(word, meaning)])]
+def parse_word_index(content):
+    verses = []
+    pairs = []
+    for line in content.split("\n"):
+        line = line.strip()
+        label = re.fullmatch(r"\((\d+)\.(\d+)\)\|\|", line)
+        if label:
+            verses.append(((label.group(1), str(int(label.group(2)))), pairs))
+            pairs = []
+        elif "=" in line:
+            word, _, meaning = line.partition("=")
+            if word.strip():
+                pairs.append((word.strip(), meaning.strip()))
+    return verses
+
+
+class WordIndex:
+    """Inverted index from normalized words to verse ordinals, plus a word → meaning glossary.
+
+    Keys come from ``word_key``, so ITRANS, IAST and plain Latin spellings of a
+    word meet, as do its Telugu, Devanagari and Kannada forms. A query term
+    also matches every longer key it is a prefix of (a cheap stand-in for
+    stemming inflected Sanskrit forms), found by bisecting the sorted keys.
+    """
+
+    def __init__(self, max_expansions=200):
+        self.max_expansions = max_expansions
+        # key -> {ordinal: weight}
+        self._postings = {}
+        # key -> [(ordinal, word, meaning)]
+        self._glossary = {}
+        self._keys = None
+        self._glossary_keys = None
+
+    def __len__(self):
+        return len(self._postings)
+
+    def add_text(self, ordinal, text, weight=1.0):
+        for token in tokenize(text):
+            key = word_key(token)
+            if len(key) < 2 or key in STOPWORDS:
+                continue
+            postings = self._postings.setdefault(key, {})
+            postings[ordinal] = postings.get(ordinal, 0.0) + weight
+        self._keys = None
+
+    def add_meaning(self, ordinal, word, meaning):
+        entry = (ordinal, word, meaning)
+        keys = {word_key(word.replace("-", ""))} | {word_key(token) for token in tokenize(word)}
+        for key in keys:
+            if key:
+                self._glossary.setdefault(key, []).append(entry)
+        self._glossary_keys = None
+
+    # Sort the keys for prefix lookups; done once after the last add instead of on the first query
+    def finalize(self):
+        self._keys = sorted(self._postings)
+        self._glossary_keys = sorted(self._glossary)
+        return self
+
+    @staticmethod
+    def _expand(keys, key, limit):
+        start = bisect.bisect_left(keys, key)
+        end = bisect.bisect_left(keys, key + "\uffff", start, min(len(keys), start + limit))
+        return keys[start:end]
+
+    def _matches(self, term):
+        if self._keys is None:
+            self._keys = sorted(self._postings)
+        key = word_key(term)
+        if not key:
+            return {}
+        scores = {}
+        for match in self._expand(self._keys, key, self.max_expansions):
+            # Exact matches count fully, longer words starting with the term half
+            factor = 1.0 if match == key else 0.5
+            for ordinal, weight in self._postings[match].items():
+                scores[ordinal] = max(scores.get(ordinal, 0.0), weight * factor)
+        return scores
+
+    # Ordinals of the verses containing all (or else most) query words, best first, and the number of hits
+    def find(self, query, limit=10):
+        terms = [term for term in tokenize(query) if word_key(term)]
+        if not terms:
+            return [], 0
+        totals = {}
+        for term in terms:
+            for ordinal, score in self._matches(term).items():
+                matched, total = totals.get(ordinal, (0, 0.0))
+                totals[ordinal] = (matched + 1, total + score)
+        ranked = heapq.nlargest(limit, totals.items(), key=lambda item: (item[1][0], item[1][1], -item[0]))
+        return [ordinal for ordinal, _ in ranked], len(totals)
+
+    # Glossary entries (ordinal, word, meaning) for a word, exact spellings before longer forms
+    def define(self, word, limit=5):
+        if self._glossary_keys is None:
+            self._glossary_keys = sorted(self._glossary)
+        key = word_key(word.replace("-", ""))
+        if not key:
+            return []
+        exact = self._glossary.get(key, [])
+        if len(exact) >= limit:
+            return exact[:limit]
+        entries = list(exact)
+        for match in self._expand(self._glossary_keys, key, self.max_expansions):
+            if match != key:
+                entries.extend(self._glossary[match])
+                if len(entries) >= limit:
+                    break
+        return entries[:limit]
+
+
+# Build the WordIndex: texts is {store name: [text per ordinal]} (verse words, full weight),
+# word_index the content of gita_word_index.txt and extended_meanings the parsed meanings_extended.json
+def build_word_index(verse_table, texts, word_index=None, extended_meanings=None):
+    index = WordIndex()
+    for store in texts.values():
+        for ordinal, text in enumerate(store):
+            index.add_text(ordinal, text)
+    for (chapter, verse), pairs in parse_word_index(word_index or ""):
+        ordinal = verse_table.ordinal(chapter, verse)
+        if ordinal is None:
+            continue
+        for word, meaning in pairs:
+            index.add_meaning(ordinal, word, meaning)
+            # English glosses make verses findable by meaning, at a lower weight than the verse words
+            index.add_text(ordinal, meaning, weight=0.25)
+    for shloka_id, data in (extended_meanings or {}).items():
+        ordinal = verse_table.ordinal(*shloka_id.split(".")[:2])
+        if ordinal is None or not isinstance(data, dict):
+            continue
+        for word, meaning in (data.get("ప్రతిపదార్థం") or {}).items():
+            index.add_meaning(ordinal, word, meaning)
+        index.add_text(ordinal, data.get("పదవిచ్ఛేదం") or "", weight=0.5)
+    return index.finalize()
+
+
+# Spelling differences that do not change how a verse is recognised: aspiration, doubled letters
+# and an anusvara written as m before a consonant
+_ASPIRATED = re.compile(r"([kgcjtdpb])h")
+_DOUBLED = re.compile(r"(.)\1+")
+_ANUSVARA = re.compile(r"m(?=[^aeiouy]|$)")
+
+
+# Phonetic search key for Latin (ITRANS, IAST or loose spelling) or Indic text; spaces are dropped
+def phonetic_key(text):
+    key = latin_key(to_latin(text) if is_indic(text) else text)
+    key = _ASPIRATED.sub(r"\1", key)
+    key = _ANUSVARA.sub("n", key)
+    return _DOUBLED.sub(r"\1", key)
+
+
+# Syllables per pada of the anushtubh metre, the metre of the two-line verses
+PADA_SYLLABLES = 8
+_VIRAMA = 0x4D
+
+
+# Syllables of a Telugu or Devanagari word: independent vowels plus consonants not followed by a virama.
+# Both blocks share the ISCII layout, so the offset of a letter in its block tells what it is.
+def count_syllables(word):
+    count = 0
+    for i, ch in enumerate(word):
+        code = ord(ch)
+        if not 0x0900 <= code < 0x0D80:
+            continue
+        offset = code & 0x7F
+        if 0x05 <= offset <= 0x14 or 0x60 <= offset <= 0x61:
+            count += 1
+        elif 0x15 <= offset <= 0x39 or 0x58 <= offset <= 0x5F:
+            following = ord(word[i + 1]) & 0x7F if i + 1 < len(word) and 0x0900 <= ord(word[i + 1]) < 0x0D80 else None
+            if following != _VIRAMA:
+                count += 1
+    return count
+
+
+# The four padas of a verse from its lines (uvacha removed). Anushtubh lines are half-verses and are cut at
+# the word boundary nearest PADA_SYLLABLES syllables (nearest the middle character for lines without Indic
+# letters); longer metres already have a pada per line. Anything beyond four padas (the six-pada verses) is
+# grouped so the padas line up with the four pada recordings.
+def split_padas(lines):
+    if len(lines) >= 4:
+        padas = [line.replace("।", " ").replace("॥", " ").strip() for line in lines]
+    else:
+        padas = []
+        for line in lines:
+            words = line.replace("।", " ").replace("॥", " ").split()
+            sizes = [count_syllables(word) for word in words]
+            target = PADA_SYLLABLES
+            if not any(sizes):
+                sizes = [len(word) for word in words]
+                target = sum(sizes) / 2
+            before, cut, gap = 0, 1, float("inf")
+            for i, size in enumerate(sizes[:-1], 1):
+                before += size
+                if abs(before - target) < gap:
+                    cut, gap = i, abs(before - target)
+            padas.extend(part for part in (" ".join(words[:cut]), " ".join(words[cut:])) if part)
+    if len(padas) > 4:
+        bounds = [len(padas) * i // 4 for i in range(5)]
+        padas = [" ".join(padas[start:end]) for start, end in zip(bounds, bounds[1:])]
+    return padas
+
+
+# Edit distance from pattern to the closest substring of text, with Myers' bit-parallel algorithm:
+# one column of the edit distance table is updated per text character in a few integer operations
+def _substring_distance(pattern, text):
+    masks = {}
+    for i, ch in enumerate(pattern):
+        masks[ch] = masks.get(ch, 0) | 1 << i
+    full = (1 << len(pattern)) - 1
+    last = 1 << (len(pattern) - 1)
+    positive, negative = full, 0
+    score = best = len(pattern)
+    for ch in text:
+        match = masks.get(ch, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        up = negative | ~(horizontal | positive) & full
+        down = positive & horizontal
+        if up & last:
+            score += 1
+        elif down & last:
+            score -= 1
+        up = up << 1 & full
+        down = down << 1 & full
+        positive = down | ~(vertical | up) & full
+        negative = up & vertical
+        best = min(best, score)
+    return best
+
+
+class PadaIndex:
+    """Typo-tolerant search over every pada of every verse.
+
+    Each pada is reduced to its ``phonetic_key`` and indexed by character
+    trigrams. A query keeps the padas sharing enough trigrams to be within
+    the allowed number of edits (each edit breaks at most three trigrams),
+    then checks the most promising ones with an approximate substring match
+    until the time budget runs out.
+    """
+
+    def __init__(self, entries):
+        # entries: iterable of (ordinal, pada number, pada text)
+        self._entries = []
+        self._keys = []
+        self._postings = {}
+        for ordinal, pada, text in entries:
+            key = phonetic_key(text)
+            position = len(self._entries)
+            self._entries.append((ordinal, pada))
+            self._keys.append(key)
+            for gram in {key[i:i + 3] for i in range(len(key) - 2)}:
+                self._postings.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # [(ordinal, pada number, edits)] for the verses whose padas best match query, closest first.
+    # Padas are verified in order of shared trigrams until budget seconds have passed.
+    def search(self, query, limit=10, budget=0.005, max_edits=None):
+        deadline = time.perf_counter() + budget
+        key = phonetic_key(query)
+        grams = {key[i:i + 3] for i in range(len(key) - 2)}
+        if not grams:
+            return []
+        if max_edits is None:
+            max_edits = max(1, len(key) // 5)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        needed = max(1, len(grams) - 3 * max_edits)
+        best = {}
+        for position, count in shared.most_common():
+            if count < needed or time.perf_counter() > deadline:
+                break
+            # Fewer shared trigrams can only mean as many edits as the current worst of a full page
+            if len(best) >= limit and (len(grams) - count + 2) // 3 >= max(edits for edits, _, _ in best.values()):
+                break
+            ordinal, pada = self._entries[position]
+            edits = _substring_distance(key, self._keys[position])
+            if edits <= max_edits and (ordinal not in best or (edits, -count) < best[ordinal][:2]):
+                best[ordinal] = (edits, -count, pada)
+        ranked = sorted(best.items(), key=lambda item: (item[1][:2], item[0]))
+        return [(ordinal, pada, edits) for ordinal, (edits, _, pada) in ranked[:limit]]
@@ -0,0 +1,143 @@
+"""Send pipeline for replies that carry several verses (n1-n5, p).
+
+Verse texts are packed into as few messages as Telegram's 4096 character
+limit allows, the audio goes out as one media group, and the two run
+concurrently. Every request waits for a slot from a per-chat and a global
+rate limiter so bursts stay within Telegram's flood limits.
+"""
+import asyncio
+import logging
+
+from telegram import InputMediaAudio
+from telegram.error import BadRequest, RetryAfter
+from telegram.request import HTTPXRequest
+
+from gita_audio_cache import file_url, retry_after_seconds
+from gita_metrics import TELEGRAM_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+MEDIA_GROUP_LIMIT = 10
+
+
+# Pack texts into messages of at most limit characters, splitting only texts that are too long on their own
+def merge_texts(texts, limit=TELEGRAM_MESSAGE_LIMIT, separator="\n\n"):
+    messages = []
+    current = ""
+    for text in texts:
+        if not text:
+            continue
+        while len(text) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(text[:limit])
+            text = text[limit:]
+        if not current:
+            current = text
+        elif len(current) + len(separator) + len(text) <= limit:
+            current += separator + text
+        else:
+            messages.append(current)
+            current = text
+    if current:
+        messages.append(current)
+    return messages
+
+
+class MeteredRequest(HTTPXRequest):
+    """Bot API transport that counts every request by method and HTTP status."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            TELEGRAM_REQUESTS.inc(endpoint, "error")
+            raise
+        TELEGRAM_REQUESTS.inc(endpoint, str(code))
+        return code, payload
+
+
+class RateLimiter:
+    """GCRA rate limiter: `rate` requests per second per key with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1, max_keys=10000):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.max_keys = max_keys
+        self._tat = {}
+
+    def _prune(self, now):
+        self._tat = {key: tat for key, tat in self._tat.items() if tat > now}
+
+    # Reserve the next slot for key and sleep until it is due
+    async def acquire(self, key=None):
+        now = asyncio.get_running_loop().time()
+        if len(self._tat) > self.max_keys:
+            self._prune(now)
+        tat = max(self._tat.get(key, now), now)
+        self._tat[key] = tat + self.interval
+        wait = tat - self.tolerance - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class SendPipeline:
+    def __init__(self, audio_handles, per_chat_rate=1.0, per_chat_burst=3, global_rate=30.0):
+        self.audio_handles = audio_handles
+        self.chat_limiter = RateLimiter(per_chat_rate, per_chat_burst)
+        self.global_limiter = RateLimiter(global_rate, int(global_rate))
+
+    async def _call(self, chat_id, send):
+        for attempt in range(3):
+            await self.chat_limiter.acquire(chat_id)
+            await self.global_limiter.acquire()
+            try:
+                return await send()
+            except RetryAfter as e:
+                if attempt == 2:
+                    raise
+                logger.warning(f"Flood control for chat {chat_id}, retrying in {e.retry_after}s")
+                await asyncio.sleep(retry_after_seconds(e))
+
+    async def _send_texts(self, message, texts):
+        for text in merge_texts(texts):
+            await self._call(message.chat_id, lambda text=text: message.reply_text(text))
+
+    async def _send_media_group(self, message, keys):
+        handles = self.audio_handles
+        # Media groups hold audio only, so voice note variants are not used here
+        sources = [handles.source(key, voice=False)[:2] for key in keys]
+        media = [InputMediaAudio(handles.get(handle_key) or file_url(path)) for handle_key, path in sources]
+        try:
+            sent = await self._call(message.chat_id, lambda: message.reply_media_group(media))
+        except BadRequest as e:
+            if not any(handle_key in handles for handle_key, _ in sources):
+                raise
+            logger.warning(f"⚠️ Media group with cached file_ids was rejected ({e}); sending by URL")
+            for handle_key, _ in sources:
+                await handles.adiscard(handle_key)
+            media = [InputMediaAudio(file_url(path)) for _, path in sources]
+            sent = await self._call(message.chat_id, lambda: message.reply_media_group(media))
+        for (handle_key, _), sent_message in zip(sources, sent or ()):
+            if sent_message.audio is not None:
+                await handles.aput(handle_key, sent_message.audio.file_id)
+
+    async def _send_audio(self, message, keys):
+        for start in range(0, len(keys), MEDIA_GROUP_LIMIT):
+            group = keys[start:start + MEDIA_GROUP_LIMIT]
+            if len(group) == 1:
+                await self._call(message.chat_id, lambda: self.audio_handles.reply_audio(message, group[0]))
+            else:
+                await self._send_media_group(message, group)
+
+    # Reply with several verse texts and audio keys using as few, concurrent requests as possible
+    async def send(self, message, texts, audio_keys):
+        jobs = []
+        if any(texts):
+            jobs.append(self._send_texts(message, texts))
+        if audio_keys:
+            jobs.append(self._send_audio(message, list(audio_keys)))
+        await asyncio.gather(*jobs)
@@ -0,0 +1,159 @@
+"""Asyncio webhook front end for the Telegram bot.
+
+Telegram POSTs updates to ``/webhook``. The handler only decodes the JSON,
+puts the update on a bounded queue and answers 200 straight away (503 when
+the queue is full, so Telegram retries later). A fixed number of worker
+tasks feed the queued updates to ``Application.process_update``. Updates
+are sharded by chat, so one chat's messages are handled in order and never
+race on the same session. On SIGTERM/SIGINT the server stops accepting
+updates, drains what is queued and shuts the application down. ``/metrics``
+serves the process metrics (see ``gita_metrics``) for Prometheus.
+"""
+import asyncio
+import json
+import logging
+import signal
+
+import tornado.web
+from telegram import Update
+
+from gita_metrics import CONTENT_TYPE, render
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+
+def _shard_key(data):
+    for field in ("message", "edited_message", "callback_query", "channel_post"):
+        payload = data.get(field)
+        if isinstance(payload, dict):
+            chat = payload.get("chat") or (payload.get("message") or {}).get("chat") or payload.get("from") or {}
+            if "id" in chat:
+                return chat["id"]
+    return data.get("update_id", 0)
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    def initialize(self, server):
+        self.server = server
+
+    def post(self):
+        server = self.server
+        if server.secret_token and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != server.secret_token:
+            raise tornado.web.HTTPError(403)
+        try:
+            data = json_loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        if not server.enqueue(data):
+            raise tornado.web.HTTPError(503)
+        self.write("OK")
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("OK")
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", CONTENT_TYPE)
+        self.write(render())
+
+
+class WebhookServer:
+    def __init__(self, application, path="/webhook", secret_token=None, workers=8, queue_size=1000, extra_handlers=()):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.queue_size = queue_size
+        self.extra_handlers = list(extra_handlers)
+        self.accepting = False
+        self._queues = []
+        self._worker_tasks = []
+
+    # Queue a decoded update for its chat's worker; False if it has to be refused
+    def enqueue(self, data):
+        if not self.accepting or not isinstance(data, dict):
+            return False
+        queue = self._queues[hash(_shard_key(data)) % len(self._queues)]
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            logger.warning("⚠️ Update queue is full, asking Telegram to retry")
+            return False
+        return True
+
+    @property
+    def queued(self):
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _worker(self, queue):
+        application = self.application
+        while True:
+            data = await queue.get()
+            try:
+                update = Update.de_json(data, application.bot)
+                if update:
+                    await application.process_update(update)
+            except Exception as e:
+                logger.error(f"Error processing update: {str(e)}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    def make_app(self):
+        return tornado.web.Application([
+            (r"/", HealthHandler),
+            (r"/metrics", MetricsHandler),
+            (self.path, WebhookHandler, {"server": self}),
+            *self.extra_handlers,
+        ])
+
+    async def serve(self, host, port, webhook_url=None, drain_timeout=25):
+        application = self.application
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:  # pragma: no cover - Windows
+                pass
+
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        per_worker = max(1, self.queue_size // self.workers)
+        self._queues = [asyncio.Queue(per_worker) for _ in range(self.workers)]
+        self._worker_tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+        http_server = self.make_app().listen(port, address=host)
+        self.accepting = True
+        if webhook_url:
+            await application.bot.set_webhook(webhook_url, secret_token=self.secret_token, allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Webhook server listening on {host}:{port}{self.path} with {self.workers} workers")
+
+        try:
+            await stop.wait()
+        finally:
+            logger.info(f"Shutting down, draining {self.queued} queued updates...")
+            self.accepting = False
+            http_server.stop()
+            try:
+                await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Gave up draining after {drain_timeout}s with {self.queued} updates left")
+            for task in self._worker_tasks:
+                task.cancel()
+            await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+            await http_server.close_all_connections()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+            await application.shutdown()
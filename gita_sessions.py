@@ -0,0 +1,324 @@
+"""Per-user session storage.
+
+Sessions live in a bounded in-memory LRU with a TTL. ``CachedSessionBackend``
+puts that cache in front of any storage that can load, store and delete
+encoded sessions by user id: ``SQLiteSessionStorage`` ships here, and a
+Redis-like store only needs the same three methods. Writes are batched:
+changed sessions are written together on ``flush()`` or once enough of them
+are pending. Handlers on the event loop use the ``a``-prefixed coroutines,
+which run the storage calls on the blocking thread pool.
+"""
+import asyncio
+import base64
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from gita_io import run_blocking
+from gita_review import ReviewDeck
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    __slots__ = ("user_id", "used", "last_ordinal", "search_prefix", "search_offset", "search_results", "script", "practice", "draws", "review", "last_item")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        # Bitmap of verse ordinals already drawn at random: bit n set means ordinal n was shown
+        self.used = 0
+        self.last_ordinal = None
+        self.search_prefix = None
+        self.search_offset = 0
+        # Ordinals listed in the last search page, selectable by number
+        self.search_results = []
+        # Text store shown instead of the default languages, e.g. "tamil_sringeri"; None for the default
+        self.script = None
+        # Progress through each practice pool, e.g. {"q1": [seed, position]} (see gita_shuffle)
+        self.practice = {}
+        # Shuffled order of random draws per chapter ("0" for the whole Gita), as [seed, position]
+        self.draws = {}
+        # Spaced-repetition deck (gita_review.ReviewDeck), created on the first grade
+        self.review = None
+        # Review item (verse or pada) shown last, which a grade reply applies to
+        self.last_item = None
+
+    def is_used(self, ordinal):
+        return self.used >> ordinal & 1
+
+    def mark_used(self, ordinal):
+        self.used |= 1 << ordinal
+
+
+def encode_session(session):
+    used = session.used.to_bytes((session.used.bit_length() + 7) // 8, "little")
+    return json.dumps({
+        "u": base64.b64encode(used).decode("ascii"),
+        "l": session.last_ordinal,
+        "sp": session.search_prefix,
+        "so": session.search_offset,
+        "sr": session.search_results,
+        "sc": session.script,
+        "pr": session.practice,
+        "d": session.draws,
+        "rv": session.review.to_dict() if session.review else None,
+        "li": session.last_item,
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_session(user_id, data):
+    fields = json.loads(data)
+    session = Session(user_id)
+    session.used = int.from_bytes(base64.b64decode(fields.get("u", "")), "little")
+    session.last_ordinal = fields.get("l")
+    session.search_prefix = fields.get("sp")
+    session.search_offset = fields.get("so", 0)
+    session.search_results = fields.get("sr", [])
+    session.script = fields.get("sc")
+    session.practice = fields.get("pr", {})
+    session.draws = fields.get("d", {})
+    session.review = ReviewDeck.from_dict(fields["rv"]) if fields.get("rv") else None
+    session.last_item = fields.get("li")
+    return session
+
+
+class SessionBackend:
+    # Session for user_id, created empty if there is none
+    def get(self, user_id):
+        raise NotImplementedError
+
+    # Record that the session changed and must be persisted
+    def save(self, session):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __len__(self):
+        raise NotImplementedError
+
+    async def aload(self, user_id):
+        return self.get(user_id)
+
+    async def adelete(self, user_id):
+        self.delete(user_id)
+
+    async def aflush(self):
+        return self.flush()
+
+
+class MemorySessionBackend(SessionBackend):
+    """LRU of at most max_sessions sessions, each dropped after ttl seconds without use."""
+
+    def __init__(self, max_sessions=10000, ttl=7 * 24 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        while self._sessions:
+            user_id, (_, touched) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - touched <= self.ttl:
+                break
+            del self._sessions[user_id]
+
+    def peek(self, user_id):
+        entry = self._sessions.get(user_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, session):
+        now = time.monotonic()
+        self._sessions[session.user_id] = (session, now)
+        self._sessions.move_to_end(session.user_id)
+        self._evict(now)
+
+    def get(self, user_id):
+        session = self.peek(user_id)
+        if session is None:
+            session = Session(user_id)
+        self.put(session)
+        return session
+
+    def save(self, session):
+        self.put(session)
+
+    def delete(self, user_id):
+        self._sessions.pop(user_id, None)
+
+
+class SQLiteSessionStorage:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def load(self, user_id, max_age):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE user_id = ? AND updated_at >= ?", (user_id, time.time() - max_age)
+            ).fetchone()
+        return row[0] if row else None
+
+    # items: iterable of (user_id, encoded session), written in one transaction
+    def store_many(self, items):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?)",
+                [(user_id, data, now) for user_id, data in items],
+            )
+
+    def delete(self, user_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def purge(self, max_age):
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,)).rowcount
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedSessionBackend(SessionBackend):
+    """Memory LRU in front of a persistent storage with batched write-behind."""
+
+    def __init__(self, storage, max_cached=10000, ttl=30 * 24 * 3600, batch_size=100):
+        self.storage = storage
+        self.ttl = ttl
+        self.batch_size = batch_size
+        # Changed sessions not yet written; they outlive eviction from the cache until the next flush
+        self._pending = {}
+        self._cache = MemorySessionBackend(max_cached, ttl)
+        self._flush_task = None
+        # Held while a batch or a deletion is written, so a /reset cannot be overtaken by an older batch
+        self._write_lock = asyncio.Lock()
+        # Loads answered from the cache vs. from storage
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _cached(self, user_id):
+        session = self._cache.peek(user_id)
+        if session is None:
+            session = self._pending.get(user_id)
+        return session
+
+    def _install(self, user_id, data):
+        # Another handler may have cached the session while storage was being read
+        session = self._cached(user_id)
+        if session is None:
+            session = decode_session(user_id, data) if data is not None else Session(user_id)
+        self._cache.put(session)
+        return session
+
+    def get(self, user_id):
+        session = self._cached(user_id)
+        if session is None:
+            self.misses += 1
+            return self._install(user_id, self.storage.load(user_id, self.ttl))
+        self.hits += 1
+        self._cache.put(session)
+        return session
+
+    async def aload(self, user_id):
+        session = self._cached(user_id)
+        if session is None:
+            self.misses += 1
+            return self._install(user_id, await run_blocking(self.storage.load, user_id, self.ttl))
+        self.hits += 1
+        self._cache.put(session)
+        return session
+
+    # Mark the session dirty; a full batch is written in the background when a loop is running
+    def save(self, session):
+        self._cache.put(session)
+        self._pending[session.user_id] = session
+        if len(self._pending) >= self.batch_size:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = loop.create_task(self.aflush())
+
+    def delete(self, user_id):
+        self._cache.delete(user_id)
+        self._pending.pop(user_id, None)
+        self.storage.delete(user_id)
+
+    async def adelete(self, user_id):
+        async with self._write_lock:
+            self._cache.delete(user_id)
+            self._pending.pop(user_id, None)
+            await run_blocking(self.storage.delete, user_id)
+
+    # Detach the pending sessions and encode them as they are right now
+    def _take_batch(self):
+        pending, self._pending = self._pending, {}
+        return pending, [(user_id, encode_session(session)) for user_id, session in pending.items()]
+
+    def _requeue(self, pending):
+        # Keep the batch (without overwriting newer changes) so the next flush retries it
+        self._pending = {**pending, **self._pending}
+
+    def flush(self):
+        if not self._pending:
+            return 0
+        pending, items = self._take_batch()
+        try:
+            self.storage.store_many(items)
+        except Exception:
+            self._requeue(pending)
+            raise
+        return len(pending)
+
+    async def aflush(self):
+        async with self._write_lock:
+            if not self._pending:
+                return 0
+            pending, items = self._take_batch()
+            try:
+                await run_blocking(self.storage.store_many, items)
+            except Exception:
+                self._requeue(pending)
+                raise
+            return len(pending)
+
+    def close(self):
+        self.flush()
+        self.storage.close()
+
+
+# Build the backend selected by SESSION_BACKEND ("memory" or "sqlite")
+def create_session_backend(kind, path=None, max_cached=10000, ttl=30 * 24 * 3600, batch_size=100):
+    if kind == "memory":
+        return MemorySessionBackend(max_cached, ttl)
+    if kind == "sqlite":
+        return CachedSessionBackend(SQLiteSessionStorage(path), max_cached, ttl, batch_size)
+    raise ValueError(f"Unknown session backend '{kind}'")
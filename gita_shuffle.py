@@ -0,0 +1,65 @@
+"""Reproducible shuffled orders that are stored as a seed and a position.
+
+``permuted(seed, position, size)`` is the element at ``position`` of a
+pseudo-random permutation of ``range(size)``, computed in O(1) without
+building the permutation: a four-round Feistel network over the smallest
+even power-of-two domain covering ``size``, cycle-walking past values that
+fall outside it. Drawing without repeats from a pool is then just advancing
+the position, and a user's progress through any pool fits in two integers.
+"""
+import random
+
+_MASK32 = 0xFFFFFFFF
+
+
+def new_seed():
+    return random.getrandbits(32)
+
+
+def _round(value, key):
+    value = (value * 0x9E3779B1 + key) & _MASK32
+    value ^= value >> 15
+    value = (value * 0x85EBCA77) & _MASK32
+    return value ^ value >> 13
+
+
+def permuted(seed, position, size):
+    if not 0 <= position < size:
+        raise IndexError(f"position {position} outside a permutation of {size}")
+    half = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    keys = [_round(seed, round_number) for round_number in range(4)]
+    value = position
+    while True:
+        left, right = value >> half, value & mask
+        for key in keys:
+            left, right = right, left ^ (_round(right, key) & mask)
+        value = left << half | right
+        if value < size:
+            return value
+
+
+# Next index of the shuffled order over range(size) kept in state ([seed, position], updated in place).
+# Once all size items have been drawn a new shuffle starts; returns (index, True if it did).
+def draw(state, size):
+    restarted = state[1] >= size
+    if restarted:
+        state[0], state[1] = new_seed(), 0
+    index = permuted(state[0], state[1], size)
+    state[1] += 1
+    return index, restarted
+
+
+# Next item of pool in the shuffled order kept in state that skip(item) does not reject, or None once the
+# order is used up. Every rejected item is passed over only once per order, so draws cost O(1) amortized.
+def draw_unused(state, pool, skip):
+    while state[1] < len(pool):
+        item = pool[permuted(state[0], state[1], len(pool))]
+        state[1] += 1
+        if not skip(item):
+            return item
+    return None
+
+
+def new_state():
+    return [new_seed(), 0]
@@ -0,0 +1,163 @@
+"""Transliteration between Latin input and the Indic scripts of the corpus.
+
+``transliterate`` reads ITRANS (``dharmakShetre``), IAST (``dharmakṣetre``)
+and the loose spellings people type (``dharmakshetre``) and writes Telugu or
+Devanagari. Case matters as in ITRANS (``Ta`` is ట, ``ta`` is త) unless the
+input is plain Title case. ``to_latin`` goes the other way, from Telugu,
+Devanagari or Kannada to IAST.
+"""
+import unicodedata
+
+TELUGU_VIRAMA = "్"
+
+# Latin spelling -> (independent vowel, vowel sign)
+VOWELS = {
+    "a": ("అ", ""),
+    "aa": ("ఆ", "ా"), "A": ("ఆ", "ా"), "ā": ("ఆ", "ా"),
+    "i": ("ఇ", "ి"),
+    "ii": ("ఈ", "ీ"), "I": ("ఈ", "ీ"), "ī": ("ఈ", "ీ"),
+    "u": ("ఉ", "ు"),
+    "uu": ("ఊ", "ూ"), "U": ("ఊ", "ూ"), "ū": ("ఊ", "ూ"),
+    "RRi": ("ఋ", "ృ"), "R^i": ("ఋ", "ృ"), "ṛ": ("ఋ", "ృ"),
+    "RRI": ("ౠ", "ౄ"), "R^I": ("ౠ", "ౄ"), "ṝ": ("ౠ", "ౄ"),
+    # Sanskrit e and o are always long; ē/ō and doubled spellings mean the same
+    "e": ("ఏ", "ే"), "E": ("ఏ", "ే"), "ē": ("ఏ", "ే"), "ee": ("ఏ", "ే"),
+    "ai": ("ఐ", "ై"),
+    "o": ("ఓ", "ో"), "O": ("ఓ", "ో"), "ō": ("ఓ", "ో"), "oo": ("ఓ", "ో"),
+    "au": ("ఔ", "ౌ"),
+}
+CONSONANTS = {
+    "k": "క", "kh": "ఖ", "g": "గ", "gh": "ఘ", "~N": "ఙ", "N^": "ఙ", "ṅ": "ఙ",
+    "c": "చ", "ch": "చ", "Ch": "ఛ", "chh": "ఛ", "C": "ఛ", "j": "జ", "jh": "ఝ", "~n": "ఞ", "JN": "ఞ", "ñ": "ఞ",
+    "T": "ట", "ṭ": "ట", "Th": "ఠ", "ṭh": "ఠ", "D": "డ", "ḍ": "డ", "Dh": "ఢ", "ḍh": "ఢ", "N": "ణ", "ṇ": "ణ",
+    "t": "త", "th": "థ", "d": "ద", "dh": "ధ", "n": "న",
+    "p": "ప", "ph": "ఫ", "b": "బ", "bh": "భ", "m": "మ",
+    "y": "య", "r": "ర", "l": "ల", "v": "వ", "w": "వ", "L": "ళ", "ḻ": "ళ",
+    "sh": "శ", "ś": "శ", "z": "శ", "Sh": "ష", "shh": "ష", "ṣ": "ష", "ss": "ష", "s": "స", "h": "హ",
+    "x": "క్ష", "ksh": "క్ష", "kSh": "క్ష", "kṣ": "క్ష", "GY": "జ్ఞ", "jñ": "జ్ఞ", "j~n": "జ్ఞ",
+}
+# Marks written after a syllable
+MARKS = {"M": "ం", ".n": "ం", ".m": "ం", "ṃ": "ం", "ṁ": "ం", "H": "ః", "ḥ": "ః", ".a": "ఽ"}
+_LONGEST = max(map(len, [*VOWELS, *CONSONANTS, *MARKS]))
+
+# Telugu -> IAST, for to_latin
+_LATIN_CONSONANTS = {
+    "క": "k", "ఖ": "kh", "గ": "g", "ఘ": "gh", "ఙ": "ṅ", "చ": "c", "ఛ": "ch", "జ": "j", "ఝ": "jh", "ఞ": "ñ",
+    "ట": "ṭ", "ఠ": "ṭh", "డ": "ḍ", "ఢ": "ḍh", "ణ": "ṇ", "త": "t", "థ": "th", "ద": "d", "ధ": "dh", "న": "n",
+    "ప": "p", "ఫ": "ph", "బ": "b", "భ": "bh", "మ": "m", "య": "y", "ర": "r", "ఱ": "r", "ల": "l", "ళ": "ḷ",
+    "వ": "v", "శ": "ś", "ష": "ṣ", "స": "s", "హ": "h",
+}
+_LATIN_VOWELS = {
+    "అ": "a", "ఆ": "ā", "ఇ": "i", "ఈ": "ī", "ఉ": "u", "ఊ": "ū", "ఋ": "ṛ", "ౠ": "ṝ",
+    "ఎ": "e", "ఏ": "ē", "ఐ": "ai", "ఒ": "o", "ఓ": "ō", "ఔ": "au",
+}
+_LATIN_SIGNS = {
+    "ా": "ā", "ి": "i", "ీ": "ī", "ు": "u", "ూ": "ū", "ృ": "ṛ", "ౄ": "ṝ",
+    "ె": "e", "ే": "ē", "ై": "ai", "ొ": "o", "ో": "ō", "ౌ": "au",
+}
+_LATIN_MARKS = {"ం": "ṃ", "ః": "ḥ", "ఁ": "m", "ఽ": "'"}
+
+
+def _tokens(text):
+    i = 0
+    while i < len(text):
+        for size in range(min(_LONGEST, len(text) - i), 0, -1):
+            token = text[i:i + size]
+            for candidate in (token, token.lower()):
+                if candidate in CONSONANTS or candidate in VOWELS or candidate in MARKS:
+                    yield candidate
+                    break
+            else:
+                continue
+            break
+        else:
+            yield None
+            return
+        i += size
+
+
+# Letters of the Telugu block mapped onto the parallel Devanagari code points
+def telugu_to_devanagari(text):
+    return "".join(chr(ord(ch) - 0x0300) if "ఀ" <= ch <= "౿" else ch for ch in text)
+
+
+# Devanagari and Kannada letters mapped onto the parallel Telugu code points
+def to_telugu_block(text):
+    out = []
+    for ch in unicodedata.normalize("NFC", text):
+        code = ord(ch)
+        if 0x0900 <= code <= 0x097F and code not in (0x0964, 0x0965):
+            ch = chr(code + 0x0300)
+        elif 0x0C80 <= code <= 0x0CFF:
+            ch = chr(code - 0x0080)
+        out.append(ch)
+    return "".join(out)
+
+
+# Transliterate Latin text into script ("telugu" or "devanagari"), or None if it has letters we cannot read.
+# With prefix=True a trailing consonant gets no virama, so "dharm" gives a prefix of ధర్మక్షేత్రే.
+def transliterate(text, script="telugu", prefix=False):
+    text = unicodedata.normalize("NFC", text.strip())
+    if text[:1].isupper() and text[1:].islower():
+        text = text.lower()
+    out = []
+    for word in text.split():
+        letters = []
+        after_consonant = False
+        for token in _tokens(word):
+            if token is None:
+                return None
+            if token in CONSONANTS:
+                if after_consonant:
+                    letters.append(TELUGU_VIRAMA)
+                letters.append(CONSONANTS[token])
+                after_consonant = True
+            elif token in VOWELS:
+                letter, sign = VOWELS[token]
+                letters.append(sign if after_consonant else letter)
+                after_consonant = False
+            else:
+                letters.append(MARKS[token])
+                after_consonant = False
+        if after_consonant and not prefix:
+            letters.append(TELUGU_VIRAMA)
+        out.append("".join(letters))
+    telugu = " ".join(out)
+    return telugu_to_devanagari(telugu) if script == "devanagari" else telugu
+
+
+# Whether Latin text is a single syllable such as "a", "ka" or "ksha" (searched for as a first letter)
+def is_syllable(text):
+    tokens = list(_tokens(text)) if text.isalpha() else [None]
+    if None in tokens or not tokens or tokens[-1] not in VOWELS:
+        return False
+    return all(token in CONSONANTS for token in tokens[:-1]) and len(tokens) <= 2
+
+
+def is_indic(text):
+    return any("ऀ" <= ch <= "ॿ" or "ఀ" <= ch <= "೿" for ch in text)
+
+
+# IAST reading of Telugu, Devanagari or Kannada text; other characters pass through
+def to_latin(text):
+    out = []
+    pending = False
+    for ch in to_telugu_block(text):
+        if ch in _LATIN_CONSONANTS:
+            if pending:
+                out.append("a")
+            out.append(_LATIN_CONSONANTS[ch])
+            pending = True
+            continue
+        if ch in _LATIN_SIGNS:
+            out.append(_LATIN_SIGNS[ch])
+        elif ch == TELUGU_VIRAMA:
+            pass
+        else:
+            if pending:
+                out.append("a")
+            out.append(_LATIN_MARKS.get(ch) or _LATIN_VOWELS.get(ch) or ch)
+        pending = False
+    if pending:
+        out.append("a")
+    return "".join(out)
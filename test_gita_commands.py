@@ -0,0 +1,29 @@
+import pytest
+
+from gita_command_cases import PARSER_CASES
+from gita_commands import Command, parse
+
+
+@pytest.mark.parametrize("text, expected", PARSER_CASES)
+def test_documented_commands(text, expected):
+    assert parse(text) == expected
+
+
+@pytest.mark.parametrize("text", ["ba", "ra", "rao", "alla", "dharma", "nava"])
+def test_audio_suffix_only_follows_commands(text):
+    assert parse(text) == Command("search", (text,))
+
+
+def test_numbers_longer_than_four_digits_are_not_commands():
+    assert parse("12345").kind == "search"
+    assert parse("n12345").kind == "search"
+
+
+def test_word_commands_keep_the_term_case():
+    assert parse("DEFINE  Yuyutsavah ") == Command("define", ("Yuyutsavah",))
+    assert parse("find") == Command("find", ("",))
+
+
+def test_audio_flags():
+    assert parse("2.47a").with_audio and not parse("2.47a").audio_only
+    assert parse("2.47ao").audio_only and not parse("2.47ao").with_audio
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import tempfile
+import types
+
+# The bot reads its settings at import: a dummy token, in-memory sessions and no GitHub refresh
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("MEANINGS_REFRESH_TTL", "0")
+os.environ.setdefault("BOT_STATE_DB", os.path.join(tempfile.mkdtemp(), "bot_state.db"))
+
+import Bhagavad_Gita_Bot as bot  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, text, user_id):
+        self.text = text
+        self.from_user = types.SimpleNamespace(id=user_id)
+        self.chat_id = user_id
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+# Sends each text as user_id and returns the replies to the last one
+def converse(user_id, *texts):
+    async def run():
+        for text in texts:
+            message = FakeMessage(text, user_id)
+            await bot.handle_message(types.SimpleNamespace(message=message), None)
+        return message.replies
+    return asyncio.run(run())
+
+
+def test_number_after_search_selects_result():
+    replies = converse(101, "sa", "2")
+    assert replies[0].startswith("1.29")
+
+
+# A bare number that selects nothing asks for a random shloka of that chapter
+def random_chapters(monkeypatch):
+    chapters = []
+    monkeypatch.setattr(bot, "get_random_shloka", lambda chapter, *args: chapters.append(chapter) or (chapter, None))
+    return chapters
+
+
+def test_number_after_search_without_hits_is_random_shloka(monkeypatch):
+    chapters = random_chapters(monkeypatch)
+    # 'sa' lists ten shlokas and 'jha' finds none, so '0' is not the tenth of the old list
+    replies = converse(102, "sa", "jha", "0")
+    assert chapters == ["0"]
+    assert replies == ["0"]
+
@@ -0,0 +1,149 @@
+"""Transcode the recitation MP3s into compact variants for slow connections.
+
+Every MP3 of the audio folders is encoded with ffmpeg into
+
+* ``opus``: speech-tuned Opus in an OGG container, sent as a Telegram voice note
+* ``mp3``: low-bitrate mono MP3, for clients and media groups that need MP3
+
+under ``AudioCompact/<variant>/``, mirroring the source layout. Files are
+encoded in parallel by a process pool. The manifest (``audio_variants.json``)
+records the content hash of every source and the size of every variant, so
+a rerun only encodes new or changed files, and the bot reads it to send the
+smallest variant a client can play:
+
+    python transcode_audio.py                    # all audio folders
+    python transcode_audio.py AudioFullSGS --jobs 8
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from gita_audio_cache import VARIANTS_DIR, VARIANTS_MANIFEST
+from gita_audio_catalog import BASE_DIR, VERSE_SETS, file_hash
+
+# Folders holding source MP3s: every per-verse audio set plus the explanations
+SOURCE_DIRS = tuple(dict.fromkeys(pattern.split("/", 1)[0] for pattern in VERSE_SETS.values()))
+# Variant -> (file extension, ffmpeg output options)
+VARIANTS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "24k", "-vbr", "on", "-application", "voip", "-ac", "1", "-f", "ogg"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-b:a", "32k", "-ac", "1", "-ar", "22050", "-f", "mp3"]),
+}
+MANIFEST_VERSION = 1
+
+
+def variant_path(source, variant):
+    return Path(VARIANTS_DIR, variant, source).with_suffix(VARIANTS[variant][0]).as_posix()
+
+
+def encode(source_path, output_path, options):
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    partial = output_path.with_name(output_path.name + ".part")
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", str(source_path), "-vn", "-map_metadata", "-1", *options, str(partial)],
+        check=True, capture_output=True,
+    )
+    os.replace(partial, output_path)
+
+
+# Runs in a worker process: hash one source and encode the variants that are missing or out of date.
+# Returns (source, manifest entry, variants encoded).
+def transcode(base_dir, source, previous, settings, force):
+    base_dir = Path(base_dir)
+    source_path = base_dir / source
+    digest = file_hash(source_path)
+    entry = {"sha256": digest, "size": source_path.stat().st_size, "variants": {}}
+    unchanged = not force and previous is not None and previous["sha256"] == digest
+    encoded = []
+    for variant, (_, options) in VARIANTS.items():
+        output = variant_path(source, variant)
+        known = (previous or {}).get("variants", {}).get(variant)
+        if unchanged and known and known.get("settings") == settings[variant] and (base_dir / output).is_file():
+            entry["variants"][variant] = known
+            continue
+        encode(source_path, base_dir / output, options)
+        entry["variants"][variant] = {"path": output, "size": (base_dir / output).stat().st_size, "settings": settings[variant]}
+        encoded.append(variant)
+    return source, entry, encoded
+
+
+def find_sources(base_dir, folders):
+    for folder in folders:
+        for path in sorted((base_dir / folder).rglob("*.mp3")):
+            yield path.relative_to(base_dir).as_posix()
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return manifest.get("files", {}) if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def save_manifest(path, files):
+    partial = f"{path}.part"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "variants": list(VARIANTS), "files": dict(sorted(files.items()))}, f, indent=1)
+    os.replace(partial, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("folders", nargs="*", default=SOURCE_DIRS, help=f"audio folders to transcode (default: {' '.join(SOURCE_DIRS)})")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="parallel ffmpeg processes")
+    parser.add_argument("--base-dir", default=str(BASE_DIR))
+    parser.add_argument("--manifest", default=VARIANTS_MANIFEST, help="manifest path, relative to the base directory")
+    parser.add_argument("--force", action="store_true", help="encode every file again")
+    args = parser.parse_args()
+    if shutil.which("ffmpeg") is None:
+        print("❌ ffmpeg not found on PATH")
+        return 1
+
+    base_dir = Path(args.base_dir)
+    manifest_path = base_dir / args.manifest
+    files = load_manifest(manifest_path)
+    sources = list(find_sources(base_dir, args.folders))
+    settings = {variant: " ".join(options) for variant, (_, options) in VARIANTS.items()}
+    started = time.perf_counter()
+    encoded = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        jobs = {pool.submit(transcode, str(base_dir), source, files.get(source), settings, args.force): source for source in sources}
+        for done, job in enumerate(as_completed(jobs), 1):
+            try:
+                source, entry, variants = job.result()
+            except (OSError, subprocess.CalledProcessError) as e:
+                failed += 1
+                print(f"❌ {jobs[job]}: {getattr(e, 'stderr', b'').decode(errors='replace').strip() or e}")
+                continue
+            files[source] = entry
+            if variants:
+                encoded += 1
+            else:
+                skipped += 1
+            if done % 100 == 0:
+                print(f"⏳ {done}/{len(sources)} files")
+
+    # Drop sources that no longer exist in the folders that were scanned, with their variants
+    scanned = tuple(f"{Path(folder).as_posix().rstrip('/')}/" for folder in args.folders)
+    current = set(sources)
+    for source in [source for source in files if source.startswith(scanned) and source not in current]:
+        for variant in files.pop(source)["variants"].values():
+            (base_dir / variant["path"]).unlink(missing_ok=True)
+    save_manifest(manifest_path, files)
+
+    source_bytes = sum(entry["size"] for entry in files.values())
+    totals = {variant: sum(entry["variants"][variant]["size"] for entry in files.values() if variant in entry["variants"]) for variant in VARIANTS}
+    print(f"✅ {encoded} transcoded, {skipped} unchanged, {failed} failed in {time.perf_counter() - started:.1f}s")
+    print(f"  sources {source_bytes / 1e6:.1f} MB, " + ", ".join(f"{variant} {size / 1e6:.1f} MB" for variant, size in totals.items()))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())